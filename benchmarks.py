@@ -0,0 +1,633 @@
+from settings import *
+import numpy as np
+from scipy import sparse
+import midi_functions as mf
+import key_detection as kd
+import pickle
+import os
+import shutil
+import tempfile
+import mido
+import pretty_midi as pm
+import smf_rewrite
+import space_saving
+import data_processing as dp
+import chord_sweep
+import corpus_stats
+import sys
+from collections import Counter
+from time import time
+
+
+'''
+Benchmarks of the vectorized kernels against the loop versions they replaced.
+Run python benchmarks.py <name>, every benchmark also checks that both
+versions give the same result.
+'''
+
+
+def reference_pianoroll_to_histo_bar(pianoroll, samples_per_bar):
+    histo_bar = np.zeros((pianoroll.shape[0], int(pianoroll.shape[1]/samples_per_bar)))
+    for i in range(0,pianoroll.shape[1]-samples_per_bar+1,samples_per_bar):
+        histo_bar[:,int(i/samples_per_bar)] = np.sum(pianoroll[:,i:i+samples_per_bar], axis=1)
+    return histo_bar
+
+
+def reference_histo_bar_to_histo_oct(histo_bar, octave):
+    histo_oct = np.zeros((octave, histo_bar.shape[1]))
+    for i in range(0, histo_bar.shape[0]-octave+1, octave):
+        histo_oct = np.add(histo_oct, histo_bar[i:i+octave])
+    return histo_oct
+
+
+def reference_histo_to_chords(histo, chord_n):
+    max_n = histo.argsort(axis=0)[-chord_n:]
+    chords = []
+    for i in range(0,max_n.shape[1]):
+        chord = []
+        for note in max_n[:,i]:
+            if histo[note,i] != 0:
+                chord.append(note)
+        chord.sort()
+        chords.append(tuple(chord))
+    return chords
+
+
+def reference_get_shift(key):
+    diatonic_scales = [tuple(np.sort((np.array((0,2,4,5,7,9,11))+i)%12)) for i in range(0,12)]
+    if key in diatonic_scales:
+        return diatonic_scales.index(key)
+    else:
+        return 'other'
+
+
+def reference_estimate_key(song_histo):
+    best_key, best_correlation = 0, -np.inf
+    for key in range(24):
+        profile = kd.major_profile if key < 12 else kd.minor_profile
+        correlation = np.corrcoef(song_histo, np.roll(profile, key % 12))[0, 1]
+        if correlation > best_correlation:
+            best_key, best_correlation = key, correlation
+    return best_key, best_correlation
+
+
+def reference_binarize_pianoroll(p):
+    for i, _ in enumerate(p):
+        for j, _ in enumerate(p[i]):
+            if p[i, j] != 0:
+                p[i,j] = 1
+    return p
+
+
+def reference_double_sample(mid):
+    p_double = mid.get_piano_roll(fs=fs*sample_factor)
+    p = []
+    for i in range(0,p_double.shape[1], sample_factor):
+        vec = np.sum(p_double[:,i:(i+sample_factor)], axis=1)
+        p.append(vec)
+    p = np.array(p)
+    p = np.transpose(p)
+    return p
+
+
+def reference_pianoroll_to_note_index(pianoroll):
+    note_ind = []
+    for i in range(0,pianoroll.shape[1]):
+        step = []
+        for j, note in enumerate(pianoroll[:,i]):
+            if note != 0:
+                step.append(j)
+        note_ind.append(tuple(step))
+    return note_ind
+
+
+def reference_root_notes(piano_roll, samples_per_bar):
+    root_list = []
+    for i in range(0, piano_roll.shape[1] - samples_per_bar + 1, samples_per_bar):
+        bar = np.sum(piano_roll[:, i : i + samples_per_bar], axis=1)
+        root_note = 0
+        for note in range(len(bar)):
+            if bar[note] != 0:
+                root_note = note
+                break
+        root_list.append(root_note)
+    return root_list
+
+
+def random_pianorolls(num_songs, num_steps, density=0.03, seed=0):
+    # Binary rolls with notes held for a few steps, like the 8th note rolls of a song
+    rng = np.random.RandomState(seed)
+    onsets = rng.rand(num_songs, num_notes, num_steps) < density/4
+    rolls = np.zeros((num_songs, num_notes, num_steps), dtype=np.uint8)
+    for hold in range(4):
+        rolls[:, :, hold:] |= onsets[:, :, :num_steps-hold]
+    return rolls
+
+
+def random_midi(rng, num_instruments=3, max_notes=60, length=20., pitches=None):
+    # Song with random notes (of pitches if given), drums, sustain pedals and pitch bends
+    midi = pm.PrettyMIDI()
+    for _ in range(rng.randint(1, num_instruments+1)):
+        instrument = pm.Instrument(0, is_drum=rng.rand() < 0.2)
+        for _ in range(rng.randint(0, max_notes)):
+            start = rng.uniform(0, length)
+            duration = rng.choice([0, 0.01, rng.uniform(0, 3)])
+            pitch = rng.randint(0, 128) if pitches is None else rng.choice(pitches)
+            instrument.notes.append(pm.Note(rng.randint(1, 127), pitch, start, start + duration))
+        for _ in range(rng.randint(0, 8)):
+            instrument.control_changes.append(pm.ControlChange(rng.choice([64, 64, 7]), rng.randint(0, 128),
+                                                               rng.uniform(0, length + 5)))
+        instrument.control_changes.sort(key=lambda change: change.time)
+        for _ in range(rng.randint(0, 6)):
+            bend = rng.choice([0, rng.randint(-8192, 8192), 8191, -8192, 4096, -4096])
+            instrument.pitch_bends.append(pm.PitchBend(int(bend), rng.uniform(0, length + 2)))
+        midi.instruments.append(instrument)
+    return midi
+
+
+def random_midi_files(folder, num_songs, seed=0):
+    # Writes random songs to folder, returns their (path, name)
+    rng = np.random.RandomState(seed)
+    files = []
+    for i in range(num_songs):
+        name = 'random%03d.mid' % i
+        random_midi(rng).write(folder + '/' + name)
+        files.append((folder + '/', name))
+    return files
+
+
+def timeit(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time()
+        result = func()
+        duration = time() - start
+        if best is None or duration < best:
+            best = duration
+    return best, result
+
+
+def benchmark_histo_kernels(num_songs=200, num_steps=2400):
+    # num_steps=2400 are 150 bars, about 5 minutes of the 8th note rolls
+    rolls = random_pianorolls(num_songs, num_steps)
+
+    def reference():
+        chords = []
+        for roll in rolls:
+            histo_bar = reference_pianoroll_to_histo_bar(roll, samples_per_bar)
+            chords.append(reference_histo_to_chords(reference_histo_bar_to_histo_oct(histo_bar, octave), chord_n))
+        return chords
+
+    def per_song():
+        return [mf.histo_to_chords(mf.pianoroll_to_histo_oct(roll, samples_per_bar, octave), chord_n)
+                for roll in rolls]
+
+    def batched():
+        histos = mf.pianoroll_to_histo_oct(rolls, samples_per_bar, octave)
+        return mf.histos_to_chords(histos, chord_n, [histos.shape[-1]]*num_songs)
+
+    reference_time, reference_chords = timeit(reference)
+    print('loop kernels:       %.3f s' % reference_time)
+    for name, func in [('vectorized kernels', per_song), ('batched kernels', batched)]:
+        duration, chords = timeit(func)
+        assert chords == reference_chords
+        print('%s: %.3f s (%.1fx)' % (name, duration, reference_time/duration))
+
+
+def edge_case_pianorolls(num_steps):
+    # An empty song, a silent song, an odd length with all-zero columns and bars,
+    # single notes at the lowest and highest pitch
+    rolls = [np.zeros((num_notes, 0)), np.zeros((num_notes, num_steps)), np.zeros((num_notes, num_steps + 3))]
+    rolls[2][[5, 60, 61], 9] = 100
+    rolls[2][:, num_steps + 2] = 64
+    for note in (0, num_notes - 1):
+        roll = np.zeros((num_notes, num_steps))
+        roll[note, ::samples_per_bar+1] = 1
+        rolls.append(roll)
+    return rolls
+
+
+def benchmark_roll_kernels(num_songs=50, num_steps=801):
+    # Velocity rolls like the ones of get_piano_roll, num_steps is odd so the
+    # last bar is incomplete
+    rng = np.random.RandomState(0)
+    velocities = rng.randint(1, 128, (num_songs, num_notes, num_steps))
+    rolls = list((random_pianorolls(num_songs, num_steps) * velocities).astype(np.float64))
+    rolls += edge_case_pianorolls(num_steps)
+
+    def reference():
+        results = []
+        for roll in rolls:
+            binary = reference_binarize_pianoroll(roll.copy())
+            results.append((binary, reference_pianoroll_to_note_index(binary),
+                            reference_root_notes(binary, samples_per_bar)))
+        return results
+
+    def vectorized():
+        results = []
+        for roll in rolls:
+            binary = mf.binarize_pianoroll(roll)
+            results.append((binary, mf.pianoroll_to_note_index(binary),
+                            mf.pianoroll_to_root_notes(binary, samples_per_bar)))
+        return results
+
+    reference_time, reference_results = timeit(reference, repeat=1)
+    print('loop binarization, note indexes and root notes: %.3f s' % reference_time)
+    duration, results = timeit(vectorized)
+    for (binary, note_ind, roots), (reference_binary, reference_note_ind, reference_roots) in zip(results, reference_results):
+        assert binary.shape == reference_binary.shape and np.array_equal(binary, reference_binary)
+        assert note_ind == reference_note_ind
+        assert roots == reference_roots
+        # The sparse rolls give the same note indexes
+        assert mf.pianoroll_to_note_index(mf.binarize_pianoroll(sparse.csr_matrix(binary))) == reference_note_ind
+    print('vectorized kernels: %.3f s (%.1fx)' % (duration, reference_time/duration))
+
+    # The pooled double sampled rolls of random songs, of an empty song and of
+    # a song with an odd number of double samples
+    midis = [random_midi(rng) for _ in range(num_songs)] + [pm.PrettyMIDI()]
+    odd = pm.PrettyMIDI()
+    odd.instruments.append(pm.Instrument(0))
+    odd.instruments[0].notes.append(pm.Note(100, 60, 0., 1.1/(fs*sample_factor)))
+    midis.append(odd)
+    num_odd = 0
+    for mid in midis:
+        p = mf.double_sample(mid)
+        reference_p = reference_double_sample(mid)
+        assert p.shape == reference_p.shape and np.array_equal(p, reference_p)
+        num_odd += mid.get_piano_roll(fs=fs*sample_factor).shape[1] % sample_factor != 0
+    assert num_odd > 0
+    print('double_sample: same rolls for', len(midis), 'songs,', num_odd, 'with an odd number of samples')
+
+
+def load_song_histos(num_songs):
+    # The song histograms of the corpus if it is processed, random ones otherwise
+    if os.path.exists(song_histo_folder):
+        files = []
+        for path, subdirs, names in os.walk(song_histo_folder):
+            files += [os.path.join(path, name) for name in names]
+        if files:
+            return np.array([pickle.load(open(f, 'rb')) for f in files])
+    rng = np.random.RandomState(0)
+    return np.round(rng.gamma(0.5, 200, (num_songs, octave)))
+
+
+def benchmark_key_estimator(num_songs=5000):
+    song_histos = load_song_histos(num_songs)
+    print('%d songs' % len(song_histos))
+
+    def reference_scale():
+        return [reference_get_shift(mf.histo_to_key(histo, key_n)) for histo in song_histos]
+
+    def scale_table():
+        return [shift if shift >= 0 else 'other' for shift in
+                kd.classify_song_histos(song_histos, key_n)[3].tolist()]
+
+    reference_time, reference_shifts = timeit(reference_scale, repeat=1)
+    print('scale lists per song:      %.3f s' % reference_time)
+    duration, shifts = timeit(scale_table)
+    assert shifts == reference_shifts
+    print('scale lookup table:        %.3f s (%.1fx)' % (duration, reference_time/duration))
+
+    def reference_template():
+        return [reference_estimate_key(histo)[0] for histo in song_histos if np.ptp(histo) > 0]
+
+    def batched_template():
+        keys, _, _ = kd.estimate_keys(song_histos)
+        return keys[np.ptp(song_histos, axis=1) > 0].tolist()
+
+    reference_time, reference_keys = timeit(reference_template, repeat=1)
+    print('key profiles per song:     %.3f s' % reference_time)
+    duration, keys = timeit(batched_template)
+    assert keys == reference_keys
+    print('batched key profiles:      %.3f s (%.1fx, %.0f songs/s)' % (duration, reference_time/duration, len(song_histos)/duration))
+    print('shifted songs: %d with scales, %d with key profiles' % (
+        sum(shift != 'other' for shift in shifts), np.sum(kd.estimate_keys(song_histos)[1] >= key_min_confidence)))
+
+
+def midi_events(filepath):
+    # The messages of every track with their absolute tick, without the end
+    # of track that mido moves to the end when saving
+    mid = mido.MidiFile(filepath)
+    tracks = []
+    for track in mid.tracks:
+        tick = 0
+        events = []
+        for msg in track:
+            tick += msg.time
+            if msg.type != 'end_of_track':
+                events.append((tick, msg.copy(time=0)))
+        tracks.append(events)
+    return mid.ticks_per_beat, tracks
+
+
+def song_notes(filepath):
+    # The notes with their start and end tick, and the piano roll
+    midi = pm.PrettyMIDI(filepath)
+    notes = sorted((instrument.is_drum, note.pitch, midi.time_to_tick(note.start), midi.time_to_tick(note.end),
+                    note.velocity) for instrument in midi.instruments for note in instrument.notes)
+    return np.array(notes, dtype=np.int64).reshape((-1, 5)), midi.get_piano_roll(fs)
+
+
+def same_notes(notes, reference_notes, tolerance=1):
+    # The same notes, their start and end ticks may differ by tolerance
+    if notes.shape != reference_notes.shape:
+        return False
+    return (np.array_equal(notes[:, [0, 1, 4]], reference_notes[:, [0, 1, 4]])
+            and np.all(np.abs(notes[:, 2:4] - reference_notes[:, 2:4]) <= tolerance))
+
+
+def run_stage(func, args):
+    try:
+        func(*args)
+        return None
+    except Exception as e:
+        return type(e)
+
+
+def benchmark_smf_rewriter(folder=source_folder, max_files=500, shift=5):
+    # Checks that the byte level tempo change and shift give the same songs
+    # as the mido and pretty_midi stages and times both. Random songs are
+    # used if there are no songs in folder.
+    files = []
+    for path, subdirs, names in os.walk(folder):
+        files += [(path + '/', name) for name in names if name.lower().endswith(('.mid', '.midi'))]
+    files = files[:max_files]
+    out = tempfile.mkdtemp()
+    try:
+        if files:
+            print('%d files of %s' % (len(files), folder))
+        else:
+            os.makedirs(out + '/random')
+            random_midi_files(out + '/random', 50)
+            random_scale_midi_files(out + '/random', 50)
+            edge_case_midi_files(out + '/random')
+            files = [(out + '/random/', name) for name in sorted(os.listdir(out + '/random'))]
+            print('%d random songs, %s has no songs' % (len(files), folder))
+        folders = dict()
+        for name in ['tempo', 'raw_tempo', 'shifted', 'raw_shifted']:
+            folders[name] = out + '/' + name + '/'
+            os.makedirs(folders[name])
+
+        def tempo_stage(func, target):
+            return [run_stage(func, (name, path, target)) for path, name in files]
+
+        def shift_stage(func, source, target):
+            return [run_stage(func, (shift, name, source, target)) for path, name in files]
+
+        reference_time, reference_errors = timeit(lambda: tempo_stage(mf.change_tempo, folders['tempo']), repeat=1)
+        duration, errors = timeit(lambda: tempo_stage(smf_rewrite.change_tempo_file, folders['raw_tempo']), repeat=1)
+        print('mido tempo change:         %.3f s' % reference_time)
+        print('byte level tempo change:   %.3f s (%.1fx)' % (duration, reference_time/duration))
+        assert [e is None for e in errors] == [e is None for e in reference_errors]
+        for (path, name), error in zip(files, errors):
+            if error is None:
+                assert midi_events(folders['raw_tempo'] + name) == midi_events(folders['tempo'] + name), name
+
+        reference_time, reference_errors = timeit(lambda: shift_stage(mf.shift_midi, folders['tempo'], folders['shifted']), repeat=1)
+        duration, errors = timeit(lambda: shift_stage(smf_rewrite.shift_midi_file, folders['raw_tempo'], folders['raw_shifted']), repeat=1)
+        print('pretty_midi shift:         %.3f s' % reference_time)
+        print('byte level shift:          %.3f s (%.1fx)' % (duration, reference_time/duration))
+        different = 0
+        compared = 0
+        for (path, name), error, reference_error in zip(files, errors, reference_errors):
+            if error is None and reference_error is None:
+                compared += 1
+                notes, roll = song_notes(folders['raw_shifted'] + name)
+                reference_notes, reference_roll = song_notes(folders['shifted'] + name)
+                # pretty_midi rounds the note times to ticks again when writing,
+                # a note that moves by a tick can move to another roll sample
+                assert same_notes(notes, reference_notes), name
+                different += not np.array_equal(roll, reference_roll)
+            else:
+                assert (error is None) == (reference_error is None), name
+        print('songs with notes one tick apart in another roll sample after the shift: %d' % different)
+        print('%d shifted songs compared' % compared)
+        assert compared > 0, 'no song was compared'
+    finally:
+        shutil.rmtree(out)
+
+
+def load_chord_stream(folder, num_songs, num_chords=20000):
+    # The chords of the processed corpus if there is one, random chords with
+    # Zipf distributed counts otherwise. The random chords are made of
+    # pitches instead of pitch classes, so that there are more distinct
+    # chords than counters. Returns the songs and where they come from.
+    if os.path.exists(folder):
+        songs = [pickle.load(open(_path + _name, 'rb')) for _path, _name in dp.walk_files(folder, '.pickle')]
+        if songs:
+            return songs, 'chords of ' + folder
+    rng = np.random.RandomState(0)
+    chords = list(set(tuple(sorted(rng.choice(num_notes, chord_n, replace=False))) for _ in range(num_chords)))
+    chords.sort()
+    rng.shuffle(chords)
+    songs = [[chords[i % len(chords)] for i in rng.zipf(1.3, 500)] for _ in range(num_songs)]
+    return songs, 'random chords, %s has no chords' % folder
+
+
+def benchmark_chord_vocabulary(folder=chords_folder, top_n=50, capacities=(100, 200, 500, 1000, 5000), num_songs=2000):
+    # Checks that the top_n chords of the Space-Saving counts are the exact
+    # vocabulary for a few numbers of counters
+    songs, source = load_chord_stream(folder, num_songs)
+    print(source)
+
+    def exact():
+        cntr = Counter()
+        for chords in songs:
+            for chord in chords:
+                if chord in cntr:
+                    cntr[chord] += 1
+                else:
+                    cntr[chord] = 1
+        return cntr
+
+    reference_time, reference_cntr = timeit(exact, repeat=1)
+    reference = reference_cntr.most_common(top_n)
+    print('%d songs, %d chords, %d distinct' % (len(songs), sum(reference_cntr.values()), len(reference_cntr)))
+    print('exact counter:          %.3f s, %d counters' % (reference_time, len(reference_cntr)))
+    for capacity in capacities:
+        def space_saving_counts():
+            cntr = space_saving.SpaceSaving(capacity)
+            for chords in songs:
+                cntr.update(chords)
+            return cntr
+
+        duration, cntr = timeit(space_saving_counts, repeat=1)
+        top = cntr.most_common(top_n)
+        same = [chord for chord, _ in top] == [chord for chord, _ in reference]
+        # Chords with the same exact count as the last chord of the
+        # vocabulary can take its place
+        last_count = reference[-1][1] if reference else 0
+        ties = len(top) == len(reference) and all(reference_cntr[chord] >= last_count for chord, _ in top)
+        guaranteed = cntr.num_guaranteed(top_n)
+        print('%5d counters:          %.3f s, count error <= %d, %d of %d guaranteed, %s' % (
+            capacity, duration, cntr.max_error(), guaranteed, top_n,
+            'same vocabulary' if same else 'same up to ties' if ties else 'different vocabulary'))
+        if cntr.max_error() == 0:
+            assert top == reference
+        if guaranteed == min(top_n, len(reference)):
+            assert same or ties
+
+
+def benchmark_chord_sweep(folder=tempo_folder2, max_files=200, extractions=((3, 8), (4, 8), (3, 4), (4, 32))):
+    # Checks that the chords of one pass over the piano rolls are the same
+    # as the ones of the histo and chord stages for every (chord_n,
+    # samples_per_bar), which roll every song again. Random rolls are used
+    # if there are no songs in folder.
+    files = list(dp.walk_folder(folder))[:max_files]
+    if files:
+        def load(i):
+            return mf.get_pianoroll(files[i][1], files[i][0], fs)
+        num_songs = len(files)
+    else:
+        rolls = random_pianorolls(50, 2400)
+        load = rolls.__getitem__
+        num_songs = len(rolls)
+    print('%d songs, %d settings' % (num_songs, len(extractions)))
+
+    def reference():
+        return [[mf.histo_to_chords(mf.pianoroll_to_histo_oct(load(i), samples, octave), n) for i in range(num_songs)]
+                for n, samples in extractions]
+
+    def one_pass():
+        songs = [chord_sweep.song_chords(load(i), extractions) for i in range(num_songs)]
+        return [list(chords) for chords in zip(*songs)]
+
+    reference_time, reference_chords = timeit(reference, repeat=1)
+    print('stages per setting:        %.3f s' % reference_time)
+    duration, chords = timeit(one_pass, repeat=1)
+    assert chords == reference_chords
+    print('one pass:                  %.3f s (%.1fx)' % (duration, reference_time/duration))
+
+
+def song_pitch_histo(_path, _name):
+    try:
+        return mf.pianoroll_to_pitch_histo(mf.get_pianoroll(_name, _path, fs))
+    except dp.file_errors:
+        return None
+
+
+def benchmark_sparse_pianorolls(folder=tempo_folder1, max_files=200):
+    # Checks that the sparse rolls of sparse_pianorolls give the same pitch
+    # histograms as the dense rolls, per song and over the corpus
+    out = tempfile.mkdtemp()
+    try:
+        files = list(dp.walk_folder(folder))[:max_files]
+        if files:
+            print('%d songs of %s' % (len(files), folder))
+        else:
+            files = random_midi_files(out, 100)
+            print('%d random songs, %s has no songs' % (len(files), folder))
+        histos = dict()
+        for use_sparse in [False, True]:
+            mf.sparse_pianorolls = use_sparse
+            duration, histos[use_sparse] = timeit(lambda: [song_pitch_histo(_path, _name) for _path, _name in files],
+                                                  repeat=1)
+            corpus_histo = corpus_stats.corpus_statistics(['histo'], files={'tempo': files})['histo']
+            assert corpus_histo.shape == (128,)
+            assert np.array_equal(corpus_histo, np.sum([h for h in histos[use_sparse] if h is not None], axis=0))
+            print('%s rolls: %.3f s' % ('sparse' if use_sparse else 'dense ', duration))
+        for dense_histo, sparse_histo in zip(histos[False], histos[True]):
+            # Both fail on the songs without a 2d roll
+            assert (dense_histo is None) == (sparse_histo is None)
+            if dense_histo is not None:
+                assert dense_histo.shape == sparse_histo.shape == (128,)
+                assert np.array_equal(dense_histo, sparse_histo)
+        print('%d songs without a roll' % sum(histo is None for histo in histos[False]))
+    finally:
+        mf.sparse_pianorolls = sparse_pianorolls
+        shutil.rmtree(out)
+
+
+def scale_midi(pitches, extra_pitches):
+    # Song that repeats the notes of a scale, with one note of every extra pitch
+    midi = pm.PrettyMIDI()
+    instrument = pm.Instrument(0)
+    for i in range(8):
+        for j, pitch in enumerate(pitches):
+            start = i*len(pitches)*0.25 + j*0.25
+            instrument.notes.append(pm.Note(100, pitch, start, start + 0.5))
+    for pitch in extra_pitches:
+        instrument.notes.append(pm.Note(100, pitch, 1., 2.))
+    midi.instruments.append(instrument)
+    return midi
+
+
+def random_scale_midi_files(folder, num_songs, seed=0):
+    # Random songs with the notes of a diatonic scale of any key up to the
+    # highest pitch, above the lowest octave so that most of them are shifted
+    rng = np.random.RandomState(seed)
+    major = [0, 2, 4, 5, 7, 9, 11]
+    for i in range(num_songs):
+        key = rng.randint(12)
+        pitches = [pitch for pitch in range(octave, 128) if (pitch - key) % 12 in major]
+        random_midi(rng, max_notes=200, pitches=pitches).write(folder + '/scale%03d.mid' % i)
+
+
+def edge_case_midi_files(folder):
+    # Songs near the lowest and highest pitch and an empty song. Returns the
+    # name of the song in D major with a C# below the shift of 2, which the
+    # shift rejects.
+    c_major = [60, 62, 64, 65, 67, 69, 71]
+    scale_midi(c_major, [0, 127]).write(folder + '/lowest_highest.mid')
+    scale_midi([pitch + 2 for pitch in c_major], [1]).write(folder + '/below_shift.mid')
+    scale_midi([pitch + 2 for pitch in c_major], [2, 127]).write(folder + '/lowest_after_shift.mid')
+    pm.PrettyMIDI().write(folder + '/empty.mid')
+    return 'below_shift.mid'
+
+
+processed_folder_names = ['source_folder', 'tempo_folder1', 'histo_folder1', 'song_histo_folder', 'tempo_folder2',
+                          'roll_folder', 'histo_folder2', 'chords_folder', 'chords_index_folder', 'dict_path']
+
+
+def set_processed_folders(source, out):
+    for name in processed_folder_names:
+        setattr(dp, name, out + '/' + name.replace('_folder', '').replace('_path', '') + '/')
+        os.makedirs(getattr(dp, name))
+    dp.source_folder = source
+
+
+def benchmark_fused(num_songs=40):
+    # Checks that the fused mode with the algebraic shift makes the same song
+    # histograms, note indexes, chords, chord dict and chord indexes as the
+    # stages, on random songs and on songs near the lowest and highest pitch
+    out = tempfile.mkdtemp()
+    folders = {name: getattr(dp, name) for name in processed_folder_names}
+    try:
+        source = out + '/source/'
+        os.makedirs(source)
+        random_midi_files(source, num_songs//4)
+        random_scale_midi_files(source, num_songs)
+        rejected = edge_case_midi_files(source)
+        runs = {'stages': lambda: dp.do_all_steps(), 'fused': lambda: dp.do_all_steps_fused(algebraic_shift=True)}
+        outputs = dict()
+        for mode in ['stages', 'fused']:
+            set_processed_folders(source, out + '/' + mode)
+            duration, _ = timeit(runs[mode], repeat=1)
+            print('%s: %.3f s' % (mode, duration))
+            outputs[mode] = {name: getattr(dp, name) for name in processed_folder_names}
+        for name in ['song_histo_folder', 'roll_folder', 'chords_folder', 'chords_index_folder', 'dict_path']:
+            stages_folder, fused_folder = outputs['stages'][name], outputs['fused'][name]
+            # Both ways, so that a file only one mode made is a mismatch too
+            mismatches = dp.compare_pickle_folders(stages_folder, fused_folder)
+            mismatches += dp.compare_pickle_folders(fused_folder, stages_folder)
+            assert not mismatches, mismatches
+        for mode in ['stages', 'fused']:
+            assert not os.path.exists(outputs[mode]['roll_folder'] + rejected + '.pickle')
+            assert os.path.exists(outputs[mode]['roll_folder'] + 'lowest_after_shift.mid.pickle')
+    finally:
+        for name, folder in folders.items():
+            setattr(dp, name, folder)
+        shutil.rmtree(out)
+
+
+benchmarks = {'histo': benchmark_histo_kernels, 'keys': benchmark_key_estimator,
+              'smf': benchmark_smf_rewriter, 'vocab': benchmark_chord_vocabulary,
+              'sweep': benchmark_chord_sweep, 'sparse': benchmark_sparse_pianorolls,
+              'rolls': benchmark_roll_kernels, 'fused': benchmark_fused}
+
+
+if __name__=="__main__":
+    names = sys.argv[1:] or sorted(benchmarks)
+    for name in names:
+        print(name)
+        benchmarks[name]()
@@ -6,6 +6,7 @@ import os
 import sys
 import pretty_midi as pm
 import mido
+import note_cache
 from collections import Counter
 from data_processing import change_tempo_folder
 import music21
@@ -94,16 +95,13 @@ def root_note_from_midi(samples_per_bar, fs, name, path, target_path):
     #piano_roll = mf.get_pianoroll(name, path, fs)
 
     # Get piano roll
-    mid = pm.PrettyMIDI(path + name)
+    mid = note_cache.read_midi(path + name)
     if double_sample_notes:
         piano_roll = mf.double_sample(mid)
     else:
         piano_roll = mid.get_piano_roll(fs=fs)
 
-    for i, _ in enumerate(piano_roll):
-        for j, _ in enumerate(piano_roll[i]):
-            if piano_roll[i, j] != 0:
-                piano_roll[i, j] = 1
+    piano_roll = mf.binarize_pianoroll(piano_roll)
 
 
     # Get Key
@@ -119,19 +117,7 @@ def root_note_from_midi(samples_per_bar, fs, name, path, target_path):
 
 
     # Get the root note of each bar
-    root_list = []
-    for i in range(0, piano_roll.shape[1] - samples_per_bar + 1, samples_per_bar):
-        bar = np.sum(piano_roll[:, i : i + samples_per_bar], axis=1)
-        #print bar
-
-        root_note = 0
-        for note in range(len(bar)):
-            if bar[note] != 0:
-                root_note = note
-                break
-
-        #print root_note, bar[root_note]
-        root_list.append(root_note)
+    root_list = mf.pianoroll_to_root_notes(piano_roll, samples_per_bar)
 
 
     chord_list = find_chord_from_root_note(key = key, root_list = root_list)
@@ -3,6 +3,7 @@ import numpy as np
 import os
 import sys
 import pickle
+import note_cache
 
 
 
@@ -93,12 +94,12 @@ def get_key_and_bass_note_from_midi(name, path):
 
     print name
 
-    mid = pm.PrettyMIDI(os.path.join(path, name) + '.mid')
+    mid = note_cache.read_midi(os.path.join(path, name) + '.mid')
 =======
     print '-----------------------------------------------------------'
     print name
 
-    mid = pm.PrettyMIDI(path + name)
+    mid = note_cache.read_midi(path + name)
     print 'Instruments: ', mid.instruments
 >>>>>>> e97ce90eef9627871dd81eb23ef5c75ef4a7e3e9
 
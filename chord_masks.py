@@ -0,0 +1,75 @@
+from settings import *
+import numpy as np
+import midi_functions as mf
+import pickle
+
+
+'''
+Chords as 12 bit pitch class masks, bit i is set if pitch class i is in the
+chord, e.g. C = (0,4,7) is 1 + 16 + 128 = 145. The chord dicts stay the
+same pickles as for the tuple chords, so trained models keep working.
+'''
+
+
+num_masks = 2**octave
+
+
+def chord_to_mask(chord):
+    mask = 0
+    for note in chord:
+        mask |= 1 << int(note)
+    return mask
+
+
+def mask_to_chord(mask):
+    # Same tuple as histo_to_chords gives for the chord
+    return tuple(mf.pitch_class_sets[mask])
+
+
+def histo_to_masks(histo, chord_n):
+    return mf.histo_to_chord_masks(histo, chord_n).astype(np.uint16)
+
+
+def load_histo_save_chord_masks(chord_n, name, histo_path, masks_path):
+    histo = pickle.load(open(histo_path + name, 'rb'))
+    pickle.dump(histo_to_masks(histo, chord_n), open(masks_path + name, 'wb'))
+
+
+class MaskCounter:
+    'counts the chord masks of all songs, remembering where every chord was seen first'
+    def __init__(self):
+        self.counts = np.zeros(num_masks, dtype=np.int64)
+        self.first_seen = np.full(num_masks, np.iinfo(np.int64).max, dtype=np.int64)
+        self.num_seen = 0
+
+    def add(self, masks):
+        masks = np.asarray(masks, dtype=np.int64)
+        self.counts += np.bincount(masks, minlength=num_masks)
+        chords, first = np.unique(masks, return_index=True)
+        self.first_seen[chords] = np.minimum(self.first_seen[chords], first + self.num_seen)
+        self.num_seen += len(masks)
+
+    def most_common(self, n):
+        # Same order as Counter.most_common over the chords in the same order:
+        # by count and then by the first occurence
+        seen = np.flatnonzero(self.counts)
+        order = np.lexsort((self.first_seen[seen], -self.counts[seen]))
+        return [(int(mask), int(self.counts[mask])) for mask in seen[order][:n]]
+
+
+def chord_dict_to_lookup(chord_to_index):
+    # Table from every mask to its chord index, UNK for chords not in the dict
+    lookup = np.full(num_masks, chord_to_index[UNK], dtype=np.int64)
+    for chord, index in chord_to_index.items():
+        if chord != UNK:
+            lookup[chord_to_mask(chord)] = index
+    return lookup
+
+
+def masks_to_index(masks, lookup):
+    return lookup[np.asarray(masks, dtype=np.int64)].tolist()
+
+
+def chord_masks_to_index_save(name, masks_path, chords_index_path, lookup):
+    masks = pickle.load(open(masks_path + name, 'rb'))
+    pickle.dump(masks_to_index(masks, lookup), open(chords_index_path + name, 'wb'))
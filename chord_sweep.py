@@ -0,0 +1,115 @@
+from settings import *
+import midi_functions as mf
+import data_processing as dp
+from functools import reduce
+from math import gcd
+import pickle
+import os
+import argparse
+
+
+'''
+Chord extraction for several settings in one pass.
+
+Every variant is a (chord_n, samples_per_bar, num_chords) combination. The
+piano roll of every song of the shifted tempo folder is made only once and
+folded into a pitch class histogram with bars of the greatest common divisor
+of the samples_per_bar of all variants. The bar histograms of a
+samples_per_bar are the sums of its consecutive fine bars, so they are the
+same as the ones of the histo stage. The chords of every (chord_n,
+samples_per_bar) are saved to their own folder in sweep_folder, and the
+chord dicts of all num_chords of it are made from one count of these chords.
+'''
+
+
+def parse_variant(text):
+    # 'chord_n=4,samples_per_bar=8,num_chords=100', the missing values are the ones of settings.py
+    variant = {'chord_n': chord_n, 'samples_per_bar': samples_per_bar, 'num_chords': num_chords}
+    for item in text.split(','):
+        key, value = item.split('=')
+        if key not in variant:
+            raise ValueError('unknown setting ' + key)
+        variant[key] = int(value)
+    return variant['chord_n'], variant['samples_per_bar'], variant['num_chords']
+
+
+def variant_name(chord_n, samples_per_bar, num_chords=None):
+    name = 'chords_n' + str(chord_n) + '_spb' + str(samples_per_bar)
+    if num_chords is not None:
+        name += '_v' + str(num_chords)
+    return name
+
+
+def variant_folder(target_folder, chord_n, samples_per_bar):
+    return target_folder + '/' + variant_name(chord_n, samples_per_bar) + subfolder
+
+
+def song_chords(pianoroll, extractions):
+    # Chords of a piano roll for every (chord_n, samples_per_bar) of extractions
+    fine_samples = reduce(gcd, [samples for _, samples in extractions])
+    fine_histo = mf.pianoroll_to_histo_oct(pianoroll, fine_samples, octave)
+    histos = dict()
+    for _, samples in extractions:
+        if samples not in histos:
+            histos[samples] = mf.pianoroll_to_histo_bar(fine_histo, samples // fine_samples)
+    return [mf.histo_to_chords(histos[samples], n) for n, samples in extractions]
+
+
+def sweep_song(name, path, extractions, target_paths):
+    pianoroll = mf.get_pianoroll(name, path, fs)
+    for chords, target_path in zip(song_chords(pianoroll, extractions), target_paths):
+        pickle.dump(chords, open(target_path + name + '.pickle', 'wb'))
+
+
+def extractions_of(variants):
+    return sorted(set((n, samples) for n, samples, _ in variants))
+
+
+def save_sweep_chords(tempo_folder, target_folder, variants, jobs=1):
+    extractions = extractions_of(variants)
+    tasks = dp.FileTasks()
+    for _path, _name in dp.walk_files(tempo_folder):
+        sub_path = _path[len(tempo_folder):]
+        target_paths = [variant_folder(target_folder, n, samples) + sub_path for n, samples in extractions]
+        for target_path in target_paths:
+            if not os.path.exists(target_path):
+                os.makedirs(target_path)
+        tasks.add(sweep_song, (_name, _path, extractions, target_paths), _name, dp.file_errors,
+                  target_paths[0] + _name + '.pickle', [_path + _name])
+    return tasks.run(jobs)
+
+
+def make_sweep_dicts(target_folder, variants):
+    # Chord dict of every variant, saved next to the chord folders
+    dicts = dict()
+    for n, samples in extractions_of(variants):
+        chord_cntr = dp.count_all_chords(variant_folder(target_folder, n, samples))
+        total = sum(chord_cntr.values())
+        for variant_num_chords in sorted(set(v for vn, vs, v in variants if (vn, vs) == (n, samples))):
+            cntr = chord_cntr.most_common(n=variant_num_chords-1)
+            name = variant_name(n, samples, variant_num_chords)
+            chord_to_index, index_to_chord = dp.save_chord_dict(
+                cntr, target_folder + '/' + name + '_chord_dict.pickle', target_folder + '/' + name + '_index_dict.pickle')
+            covered = sum(count for _, count in cntr)
+            print('%s: %d distinct chords, %.1f%% of the bars in the vocabulary'
+                  % (name, len(chord_cntr), 100.*covered/max(total, 1)))
+            dicts[(n, samples, variant_num_chords)] = chord_to_index, index_to_chord
+    return dicts
+
+
+def sweep(variants, tempo_folder=tempo_folder2, target_folder=sweep_folder, jobs=1):
+    print('extracting chords of', len(extractions_of(variants)), 'settings')
+    save_sweep_chords(tempo_folder, target_folder, variants, jobs)
+    print('getting dictionaries')
+    return make_sweep_dicts(target_folder, variants)
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Extract the chords and chord dicts of several settings in one pass.')
+    parser.add_argument('variants', nargs='+', type=parse_variant, metavar='VARIANT',
+                        help='like chord_n=4,samples_per_bar=8,num_chords=100, missing values are the ones of settings.py')
+    parser.add_argument('--folder', default=tempo_folder2)
+    parser.add_argument('--output', default=sweep_folder)
+    parser.add_argument('--jobs', type=int, default=num_jobs)
+    args = parser.parse_args()
+    sweep(args.variants, args.folder, args.output, args.jobs)
@@ -0,0 +1,99 @@
+from settings import *
+from manifest import save_pickle
+from collections import Counter
+import heapq
+import pickle
+import os
+
+
+'''
+Incremental chord vocabulary.
+
+The chord counts of every song are kept in dict_path + chord_counts_name
+with the size and modification time of its chords file. When songs are
+added, changed or removed only their chords files are read and their counts
+added to or subtracted from the total counts, and the vocabulary is taken
+from the total counts without reading the corpus. The counts of the songs
+also tell which songs contain a chord whose index changed in the new
+vocabulary, only their index sequences have to be made again. A stable
+chord dict keeps the index of every chord of the old dict, so the trained
+chord models stay valid, and new chords only get the free indexes.
+'''
+
+
+class ChordCounts:
+    'chord counts of every song of the chords folder and their sum'
+    def __init__(self, counts_path):
+        self.counts_path = counts_path
+        # chords file -> (size, mtime, Counter of its chords)
+        self.songs = dict()
+        self.totals = Counter()
+        if os.path.exists(counts_path):
+            data = pickle.load(open(counts_path, 'rb'))
+            self.songs = data['songs']
+            self.totals = data['totals']
+
+    def update(self, files):
+        # Counts the new and changed songs of files (_path, _name) and removes
+        # the songs that are not in files anymore. Returns the chords files of
+        # the new and changed songs and of the removed songs.
+        changed = []
+        seen = set()
+        for _path, _name in files:
+            filepath = _path + _name
+            seen.add(filepath)
+            stat = os.stat(filepath)
+            cached = self.songs.get(filepath)
+            if cached is not None and (cached[0], cached[1]) == (stat.st_size, stat.st_mtime):
+                continue
+            cntr = Counter(pickle.load(open(filepath, 'rb')))
+            if cached is not None:
+                self.totals.subtract(cached[2])
+            self.totals.update(cntr)
+            self.songs[filepath] = (stat.st_size, stat.st_mtime, cntr)
+            changed.append(filepath)
+        removed = [filepath for filepath in self.songs if filepath not in seen]
+        for filepath in removed:
+            self.totals.subtract(self.songs.pop(filepath)[2])
+        # Drops the chords that are not in any song anymore
+        self.totals = +self.totals
+        return changed, removed
+
+    def most_common(self, n):
+        # Chords with the same count are ordered by chord, so the vocabulary
+        # does not depend on the order in which the songs were added
+        return heapq.nsmallest(n, self.totals.items(), key=lambda item: (-item[1], item[0]))
+
+    def songs_with(self, chords):
+        # Chords files of the songs that contain one of chords
+        return [filepath for filepath, (_, _, cntr) in self.songs.items() if not chords.isdisjoint(cntr)]
+
+    def save(self):
+        data = {'songs': self.songs, 'totals': self.totals}
+        save_pickle(data, self.counts_path)
+
+
+def stable_chord_dict(chord_to_index, cntr, num_chords):
+    # Keeps the index of every chord of chord_to_index below num_chords and
+    # gives the chords of cntr that are not in it the free indexes up to
+    # num_chords. The chords with higher indexes of a dict made with more
+    # chords are left out, so they get the index of UNK.
+    dropped = [chord for chord, index in chord_to_index.items() if index >= num_chords]
+    if dropped:
+        print('warning:', len(dropped), 'chords of the chord dict have an index of at least num_chords =',
+              num_chords, 'and are mapped to UNK')
+    chord_to_index = {chord: index for chord, index in chord_to_index.items() if index < num_chords}
+    for chord, _ in cntr:
+        if len(chord_to_index) >= num_chords:
+            break
+        if chord not in chord_to_index:
+            chord_to_index[chord] = len(chord_to_index)
+    return chord_to_index
+
+
+def changed_chords(old_chord_to_index, chord_to_index):
+    # Chords that get another index from the new chord dict, the chords that
+    # are not in a dict get the index of UNK
+    chords = (set(old_chord_to_index) | set(chord_to_index)) - {UNK}
+    return set(chord for chord in chords if old_chord_to_index.get(chord, old_chord_to_index[UNK])
+               != chord_to_index.get(chord, chord_to_index[UNK]))
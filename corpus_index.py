@@ -0,0 +1,137 @@
+from settings import *
+import numpy as np
+import pickle
+import fnmatch
+import os
+import argparse
+
+
+'''
+Index of the songs of the corpus.
+
+Every song is stored by its path relative to the corpus root, like
+'I/I/I/TRIIIMY128F4259A8E/e77645a3b67ab40130aebdbd9409f0d5.mid' for the
+Lakh MIDI dataset, where the last folder is the MSD track ID and the file
+name the MD5 hash of the MIDI file. The paths are sorted, so the songs of
+every folder are a range of the index and membership, folder prefix, MSD
+ID and hash queries are dict lookups. The processed folders have the same
+structure as the source folder, so their files are listed from the index
+as well instead of walking the folders.
+'''
+
+
+class CorpusIndex:
+    'sorted song paths of the corpus with lookups by path, folder, MSD track ID and MIDI hash'
+    def __init__(self, keys):
+        self.keys = sorted(keys)
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        # folder -> (start, end) of its songs, '' is the whole corpus
+        self.folder_ranges = {'': (0, len(self.keys))}
+        self.hash_positions = dict()
+        for i, key in enumerate(self.keys):
+            parts = key.split('/')
+            for depth in range(1, len(parts)):
+                folder = '/'.join(parts[:depth])
+                start, _ = self.folder_ranges.get(folder, (i, i))
+                self.folder_ranges[folder] = (start, i + 1)
+            self.hash_positions.setdefault(os.path.splitext(parts[-1])[0], []).append(i)
+        # MSD track ID -> its folder
+        self.msd_folders = {folder.split('/')[-1]: folder for folder in self.folder_ranges
+                            if folder.split('/')[-1].startswith('TR')}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def glob(self, pattern):
+        # Songs matching a pattern, all songs below a folder ('A/B/*' or 'A/B')
+        # are a lookup and other patterns are matched against every song
+        folder = '' if pattern == '*' else pattern[:-2] if pattern.endswith('/*') else pattern
+        if any(c in folder for c in '*?['):
+            return fnmatch.filter(self.keys, pattern)
+        if folder in self.positions:
+            return [folder]
+        start, end = self.folder_ranges.get(folder, (0, 0))
+        return self.keys[start:end]
+
+    def by_msd_id(self, msd_id):
+        folder = self.msd_folders.get(msd_id)
+        if folder is None:
+            return []
+        return self.glob(folder + '/*')
+
+    def by_hash(self, midi_hash):
+        return [self.keys[i] for i in self.hash_positions.get(midi_hash, [])]
+
+    def files(self, folder, prefix='', suffix=''):
+        # (path, name) of the songs below prefix in a folder with the structure
+        # of the corpus root, like walk_files. prefix is a subfolder like
+        # '/A/A' that the folder already contains, suffix is added to the names.
+        prefix = prefix.strip('/')
+        skip = len(prefix) + 1 if prefix else 0
+        files = []
+        for key in self.glob(prefix):
+            song_folder, name = os.path.split(key[skip:])
+            _path = folder + '/' + song_folder + '/' if song_folder else folder + '/'
+            files.append((_path, name + suffix))
+        return files
+
+    def save(self, index_path):
+        pickle.dump(np.array(self.keys, dtype=bytes), open(index_path, 'wb'))
+
+    @staticmethod
+    def load(index_path):
+        return CorpusIndex([key.decode('utf-8') for key in pickle.load(open(index_path, 'rb'))])
+
+    @staticmethod
+    def from_paths(paths, root=None):
+        # Index of absolute song paths, relative to root or their common folder
+        if root is None:
+            root = os.path.commonpath(paths)
+        root = root.rstrip('/') + '/'
+        return CorpusIndex([path[len(root):] for path in paths if path.startswith(root)])
+
+    @staticmethod
+    def from_folder(folder):
+        paths = []
+        for path, subdirs, files in os.walk(folder):
+            _path = path.replace('\\', '/') + '/'
+            paths += [_path + name.replace('\\', '/') for name in files]
+        return CorpusIndex.from_paths(paths, folder)
+
+
+_corpus_index = None
+
+
+def load_corpus_index():
+    # The saved index, or the index of corpus_paths_file if there is none
+    if os.path.exists(corpus_index_path):
+        return CorpusIndex.load(corpus_index_path)
+    return CorpusIndex.from_paths(pickle.load(open(corpus_paths_file, 'rb')))
+
+
+def get_corpus_index():
+    # The index the stages list their songs from, only the songs kept by the
+    # deduplication if use_dedup_index is set
+    global _corpus_index
+    if _corpus_index is None:
+        if use_dedup_index:
+            _corpus_index = CorpusIndex.load(dedup_index_path)
+        else:
+            _corpus_index = load_corpus_index()
+    return _corpus_index
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Make the corpus index.')
+    parser.add_argument('--folder', help='index the files of this folder instead of corpus_paths_file')
+    parser.add_argument('--output', default=corpus_index_path)
+    args = parser.parse_args()
+    if args.folder:
+        index = CorpusIndex.from_folder(args.folder)
+    else:
+        index = CorpusIndex.from_paths(pickle.load(open(corpus_paths_file, 'rb')))
+    index.save(args.output)
+    print(len(index), 'songs in', len(index.msd_folders), 'MSD tracks')
@@ -0,0 +1,147 @@
+from settings import *
+import numpy as np
+import midi_functions as mf
+import data_processing as dp
+import key_detection as kd
+import pickle
+import sys
+import argparse
+from collections import Counter
+
+
+'''
+Corpus statistics in one parallel pass.
+
+Every statistic is a reduction: a map function that makes a partial result
+of one song and a merge of the partial results. All requested statistics
+that read the same folder share one walk and one load of every file. The
+files are split into chunks, every worker reduces its chunks and the
+partial Counters and arrays are merged in the order of the files, so the
+results are the same as the ones of count_keys, count_scales, count_chords,
+count_chords2 and histo_of_all_songs in data_processing.
+'''
+
+
+def load_pickle(name, path):
+    return pickle.load(open(path + name, 'rb'))
+
+
+def load_pianoroll(name, path):
+    return mf.get_pianoroll(name, path, fs)
+
+
+# Folders the statistics are computed from, with the function that loads a file
+# and the extension of the file names
+sources = {
+    'song_histo': (lambda: song_histo_folder, load_pickle, '.pickle'),
+    'chords': (lambda: chords_folder, load_pickle, '.pickle'),
+    'unshifted_chords': (lambda: chords_folder.replace('/shifted', ''), load_pickle, '.pickle'),
+    'tempo': (lambda: tempo_folder1, load_pianoroll, ''),
+}
+
+
+def map_keys(song_histo):
+    return Counter([mf.histo_to_key(song_histo, key_n)])
+
+
+def map_scales(song_histo):
+    scale_cntr = Counter()
+    other_cntr = Counter()
+    key = mf.histo_to_key(song_histo, key_n)
+    family = kd.get_family(key)
+    scale_cntr[family] +=1
+    if family == 'other':
+        other_cntr[key] +=1
+    return scale_cntr, other_cntr
+
+
+def map_estimated_keys(song_histo):
+    return Counter(kd.estimated_key_names(song_histo))
+
+
+def map_chords(chords):
+    return Counter(chords)
+
+
+def map_histo(pianoroll):
+    return mf.pianoroll_to_pitch_histo(pianoroll, np.float64)
+
+
+# name -> (source, map function)
+reductions = {
+    'keys': ('song_histo', map_keys),
+    'scales': ('song_histo', map_scales),
+    'estimated_keys': ('song_histo', map_estimated_keys),
+    'chords': ('chords', map_chords),
+    'unshifted_chords': ('unshifted_chords', map_chords),
+    'histo': ('tempo', map_histo),
+}
+
+
+def merge(result, partial):
+    if result is None:
+        return partial
+    if isinstance(result, tuple):
+        return tuple(merge(r, p) for r, p in zip(result, partial))
+    if isinstance(result, Counter):
+        result.update(partial)
+        return result
+    return result + partial
+
+
+def reduce_chunk(task):
+    # Reduces the files of a chunk, returns the partial results and the errors
+    source, files, names = task
+    load = sources[source][1]
+    results = dict.fromkeys(names)
+    failed = []
+    for _path, _name in files:
+        try:
+            song = load(_name, _path)
+            # A song without a 2d roll fails in the map functions
+            partial = [reductions[name][1](song) for name in names]
+        except dp.file_errors as e:
+            failed.append(('Unexpected error in ' + _name  + ':\n', str(e), str(sys.exc_info()[0])))
+            continue
+        for name, song_partial in zip(names, partial):
+            results[name] = merge(results[name], song_partial)
+    return results, failed
+
+
+def corpus_statistics(names, jobs=1, chunk_size=256, files=None):
+    # Computes the statistics names in one pass over every folder they need.
+    # files can give the file list of a source instead of walking its folder.
+    results = dict.fromkeys(names)
+    for source in sorted(set(reductions[name][0] for name in names)):
+        source_names = [name for name in names if reductions[name][0] == source]
+        if files is not None and source in files:
+            source_files = files[source]
+        else:
+            source_files = list(dp.walk_files(sources[source][0](), sources[source][2]))
+        tasks = [(source, source_files[i:i+chunk_size], source_names)
+                 for i in range(0, len(source_files), chunk_size)]
+        partials = list(dp.imap_jobs(reduce_chunk, tasks, jobs))
+        failed = []
+        for partial, chunk_failed in partials:
+            failed += chunk_failed
+            for name in source_names:
+                if partial[name] is not None:
+                    results[name] = merge(results[name], partial[name])
+        dp.report_errors(failed, len(source_files))
+    return results
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Compute corpus statistics in one pass.')
+    parser.add_argument('names', nargs='+', choices=sorted(reductions))
+    parser.add_argument('--jobs', type=int, default=num_jobs)
+    parser.add_argument('--output', default=dict_path + 'corpus_stats.pickle')
+    args = parser.parse_args()
+    results = corpus_statistics(args.names, args.jobs)
+    pickle.dump(results, open(args.output, 'wb'))
+    for name in args.names:
+        print(name)
+        if isinstance(results[name], Counter):
+            print(results[name].most_common(20))
+        else:
+            print(results[name])
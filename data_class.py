@@ -4,6 +4,9 @@ import numpy as np
 import pickle
 import os
 import midi_functions as mf
+import packed_data
+import corpus_index
+import quarantine
 
 
 def get_chord_train_and_test_set(train_set_size, test_set_size):
@@ -13,7 +16,10 @@ def get_chord_train_and_test_set(train_set_size, test_set_size):
     return train_set, test_set
 
 def get_ind_train_and_test_set(train_set_size, test_set_size):
-    data, chord_data = make_ind_data_set()
+    if use_packed_data:
+        data, chord_data = packed_data.load_packed_ind_data_set(packed_folder)
+    else:
+        data, chord_data = make_ind_data_set()
     train_set = data[:train_set_size]
     test_set = data[train_set_size:train_set_size+test_set_size]
     chord_train_set = chord_data[:train_set_size]
@@ -69,16 +75,29 @@ def make_data_sets(train_set_size, test_set_size):
     return X_train, Y_train, X_test, Y_test
 
 
-def make_data_location_list():
+def list_song_files(folder):
+    # The (path, name) of the processed files of the songs that are trained
+    # on. The songs that failed a stage are skipped if use_quarantine is set.
+    quarantined = quarantine.quarantined_names()
+    if use_corpus_index or use_dedup_index:
+        # The songs are listed from the corpus index instead of walking the folder
+        files = corpus_index.get_corpus_index().files(folder, subfolder, '.pickle')
+        return [(_path, _name) for _path, _name in files if os.path.exists(_path + _name)
+                and not quarantine.is_quarantined_song(_name, quarantined)]
     data = []
-    for path, subdirs, files in os.walk(chords_index_folder):
+    for path, subdirs, files in os.walk(folder):
         for name in files:
             _path = path.replace('\\', '/') + '/'
             _name = name.replace('\\', '/')
-            song = _path + _name
-            data.append(song)
+            if quarantine.is_quarantined_song(_name, quarantined):
+                continue
+            data.append((_path, _name))
     return data
 
+
+def make_data_location_list():
+    return [_path + _name for _path, _name in list_song_files(chords_index_folder)]
+
 def load_data_set(data_string):
     data = []
     for path in data_string:
@@ -89,10 +108,13 @@ def load_data_set(data_string):
 
 def make_chord_data_set():
     data = []
+    quarantined = quarantine.quarantined_names()
     for path, subdirs, files in os.walk(chords_index_folder):
         for name in files:
             _path = path.replace('\\', '/') + '/'
             _name = name.replace('\\', '/')
+            if quarantine.is_quarantined_song(_name, quarantined):
+                continue
             song = pickle.load(open(_path + _name, 'rb'))
             data.append(song)
     return data
@@ -100,10 +122,13 @@ def make_chord_data_set():
 
 def make_data_set():
     data = []
+    quarantined = quarantine.quarantined_names()
     for path, subdirs, files in os.walk(tempo_folder):
         for name in files:
             _path = path.replace('\\', '/') + '/'
             _name = name.replace('\\', '/')
+            if quarantine.is_quarantined_song(_name, quarantined):
+                continue
             pianoroll = mf.get_pianoroll(_name, _path, melody_fs)
             song = mf.pianoroll_to_note_index(pianoroll)
             data.append(song)
@@ -112,15 +137,12 @@ def make_data_set():
 def make_ind_data_set():
     data = []
     chord_data = []
-    for path, subdirs, files in os.walk(roll_folder):
-        for name in files:
-            _path = path.replace('\\', '/') + '/'
-            _name = name.replace('\\', '/')
-            song = pickle.load(open(_path + _name, 'rb'))
-            _chord_path = _path.replace('indroll', 'chord_index')
-            song_chords = pickle.load(open(_chord_path + _name, 'rb'))
-            data.append(song)
-            chord_data.append(song_chords)
+    for _path, _name in list_song_files(roll_folder):
+        song = pickle.load(open(_path + _name, 'rb'))
+        _chord_path = _path.replace('indroll', 'chord_index')
+        song_chords = pickle.load(open(_chord_path + _name, 'rb'))
+        data.append(song)
+        chord_data.append(song_chords)
     return data, chord_data
 
 
@@ -8,7 +8,222 @@ import pretty_midi as pm
 import mido
 from collections import Counter
 import json
-    
+import argparse
+import multiprocessing
+import subprocess
+import hashlib
+from manifest import Manifest, shard_file_name
+import packed_data
+import chord_masks as cm
+import key_detection as kd
+import smf_rewrite
+import note_cache
+import corpus_index
+import quarantine
+import file_watchdog
+import stage_scheduler
+import space_saving
+import chord_vocabulary
+import time
+
+
+file_errors = (ValueError, EOFError, IndexError, OSError, KeyError, ZeroDivisionError)
+
+
+def walk_folder(folder):
+    for path, subdirs, files in os.walk(folder):
+        for name in files:
+            _path = path.replace('\\', '/') + '/'
+            _name = name.replace('\\', '/')
+            yield _path, _name
+
+
+def walk_files(folder, suffix=''):
+    # Files of the songs in the source folder or a processed folder, listed
+    # from the corpus index instead of walking the folder if use_corpus_index
+    # or use_dedup_index is set. suffix is the extension a stage added to the
+    # song names, songs without a file in the folder (like the ones a stage
+    # skipped) are left out. With num_shards > 1 only the songs of shard
+    # shard_index are listed.
+    if use_corpus_index or use_dedup_index:
+        # The processed folders only contain the songs of subfolder
+        prefix = '' if folder == source_folder else subfolder
+        files = corpus_index.get_corpus_index().files(folder, prefix, suffix)
+        files = ((_path, _name) for _path, _name in files if os.path.exists(_path + _name))
+    else:
+        files = walk_folder(folder)
+    for _path, _name in files:
+        if num_shards == 1 or song_shard(_name, num_shards) == shard_index:
+            yield _path, _name
+
+
+def song_shard(name, num_shards):
+    # Shard of a song by the hash of its name, the processed files of a song
+    # are named after the MIDI file
+    if name.endswith('.pickle'):
+        name = name[:-len('.pickle')]
+    return int(hashlib.md5(name.encode('utf-8')).hexdigest(), 16) % num_shards
+
+
+def set_shard(index, count):
+    global shard_index, num_shards
+    shard_index = index
+    num_shards = count
+    quarantine.set_shard(index, count)
+
+
+def run_file_task(task):
+    # Runs one per file call and returns the error instead of printing it,
+    # so that it can be reported after all workers are done
+    func, args, name, errors = task
+    try:
+        func(*args)
+    except errors as e:
+        return 'Unexpected error in ' + name  + ':\n', str(e), str(sys.exc_info()[0])
+    return None
+
+
+def imap_jobs(func, tasks, jobs=1, chunksize=1):
+    # Yields func of every task in order, computed serially or in a process
+    # pool with jobs workers that is closed when the results are consumed
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for result in pool.imap(func, tasks, chunksize):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            yield func(task)
+
+
+def run_file_tasks(tasks, jobs=1):
+    # Runs the per file tasks serially or in a process pool with jobs workers,
+    # returns the error of every task or None if it succeeded. With
+    # file_timeout or file_memory_limit the workers are supervised and a
+    # worker that exceeds a limit is replaced, see file_watchdog.py.
+    if file_timeout is not None or file_memory_limit is not None:
+        results = file_watchdog.run_supervised_tasks(run_file_task, tasks, jobs, file_timeout,
+                                                     file_memory_limit)
+    else:
+        results = list(imap_jobs(run_file_task, tasks, jobs, max(1, int(len(tasks)/(jobs*16)))))
+    failed = [exception_str for exception_str in results if exception_str is not None]
+    report_errors(failed, len(tasks))
+    return results
+
+
+class FileTasks:
+    'collects the per file calls of a stage, skipping the files that are up to date in the manifest'
+    # and the files that failed the stage before if use_quarantine is set. The
+    # first input file is the one that is quarantined. With output_folder (or
+    # a list of folders) the files the manifest recorded for the stage in
+    # output_folder whose task is not scheduled anymore, like the files of
+    # removed songs, are deleted. A task can write extra_outputs besides its
+    # output file, they are recorded if the task wrote them.
+    def __init__(self, manifest=None, output_folder=None):
+        self.manifest = manifest
+        self.output_folders = [output_folder] if isinstance(output_folder, str) else output_folder
+        self.quarantine = quarantine.get_quarantine()
+        self.tasks = []
+        self.products = []
+        self.stages = set()
+        self.outputs = set()
+        self.num_skipped = 0
+        self.num_quarantined = 0
+        self.num_removed = 0
+
+    def add(self, func, args, name, errors, output_file, input_files, extra_outputs=()):
+        if self.skip(func, output_file, input_files, extra_outputs):
+            return
+        self.tasks.append((func, args, name, errors))
+        self.products.append((output_file, input_files, extra_outputs))
+
+    def skip(self, func, output_file, input_files, extra_outputs=()):
+        # If the task does not have to run, every scheduled task goes through here
+        self.stages.add(func.__name__)
+        self.outputs.add(output_file)
+        self.outputs.update(extra_outputs)
+        if self.quarantine is not None and self.quarantine.is_quarantined(input_files[0], func.__name__):
+            self.num_quarantined += 1
+            return True
+        if self.manifest is not None and self.manifest.is_up_to_date(output_file, input_files, func.__name__):
+            self.num_skipped += 1
+            return True
+        return False
+
+    def remove_extra_outputs(self):
+        # The extra outputs of the tasks that run again, a task does not
+        # write all of them every time, like the rolls of an unshifted song
+        if self.manifest is None:
+            return
+        for _, _, extra_outputs in self.products:
+            for output_file in extra_outputs:
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+
+    def record(self, func, output_file, input_files, exception_str, extra_outputs=()):
+        # Records the result of a task in the manifest and the quarantine
+        if self.manifest is not None:
+            for product in [output_file] + list(extra_outputs):
+                if exception_str is None and os.path.exists(product):
+                    self.manifest.record(product, input_files, func.__name__)
+                else:
+                    self.manifest.forget(product)
+        if self.quarantine is not None and exception_str is not None:
+            self.quarantine.add(input_files[0], func.__name__, exception_str[2])
+
+    def remove_stale(self):
+        if self.manifest is None or self.output_folders is None:
+            return
+        stale = [output_file for output_folder in self.output_folders
+                 for output_file in self.manifest.stale_outputs(self.stages, output_folder, self.outputs)]
+        if num_shards > 1:
+            # The other shards did not schedule their songs in this run
+            stale = [output_file for output_file in stale
+                     if song_shard(os.path.basename(output_file), num_shards) == shard_index]
+        for output_file in stale:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            self.manifest.forget(output_file)
+        self.num_removed = len(stale)
+
+    def print_skipped(self):
+        if self.num_skipped:
+            print(self.num_skipped, 'files are up to date')
+        if self.num_quarantined:
+            print(self.num_quarantined, 'files are quarantined')
+
+    def print_removed(self):
+        if self.num_removed:
+            print(self.num_removed, 'outdated files removed')
+
+    def save(self):
+        if self.manifest is not None:
+            self.manifest.save()
+        if self.quarantine is not None:
+            self.quarantine.save()
+
+    def run(self, jobs=1):
+        self.print_skipped()
+        self.remove_extra_outputs()
+        results = run_file_tasks(self.tasks, jobs)
+        for (func, _, _, _), (output_file, input_files, extra_outputs), exception_str in zip(
+                self.tasks, self.products, results):
+            self.record(func, output_file, input_files, exception_str, extra_outputs)
+        self.remove_stale()
+        self.print_removed()
+        self.save()
+        return results
+
+
+def report_errors(failed, num_files):
+    for exception_str in failed:
+        print(exception_str)
+    if failed:
+        print(len(failed), 'of', num_files, 'files failed')
+
 
 def histo_of_all_songs():
     histo = [0]*128
@@ -18,7 +233,7 @@ def histo_of_all_songs():
             _name = name.replace('\\', '/')
 #            _name = _name[:-7]
             pianoroll = mf.get_pianoroll(_name, _path, fs)
-            histo += np.sum(pianoroll, axis=1)
+            histo += mf.pianoroll_to_pitch_histo(pianoroll)
 #            print(histo)
 #            print(_name)
     return histo
@@ -50,43 +265,44 @@ def get_scales():
 
 
 def get_shift(scale):
-    diatonic_scales, harmonic_scales, melodic_scales, blues_scales = get_scales()
-    if scale in diatonic_scales:
-        return diatonic_scales.index(scale)
-#    elif scale in harmonic_scales:
-#        return harmonic_scales.index(scale)
-#    elif scale in melodic_scales:
-#        return melodic_scales.index(scale)
-    else:
-        return 'other'
+    # Diatonic scales are shifted to C major, the others are not used
+    return kd.get_shift(scale)
 
 
 
-def shift_midi_files(song_histo_folder,tempo_folder,shifted_folder):
-    for path, subdirs, files in os.walk(song_histo_folder):
-        for name in files:
-            _path = path.replace('\\', '/') + '/'
-            _name = name.replace('\\', '/')
-            tempo_path = tempo_folder+_path[len(song_histo_folder):]
-            target_path = shifted_folder+_path[len(song_histo_folder):]
-            song_histo = pickle.load(open(_path + _name, 'rb'))
-            key = mf.histo_to_key(song_histo, key_n)
-            shift = get_shift(key)
-            _name = _name[:-7]
-            if shift != 'other':
-                if not os.path.exists(target_path):
-                    os.makedirs(target_path)
-                try:
-                    mf.shift_midi(shift, _name, tempo_path, target_path)
-                except (ValueError, EOFError, IndexError, OSError, KeyError, ZeroDivisionError) as e:
-                    exception_str = 'Unexpected error in ' + name  + ':\n', e, sys.exc_info()[0]
-                    print(exception_str)
+def shift_midi_files(song_histo_folder,tempo_folder,shifted_folder, jobs=1, manifest=None):
+    tasks = FileTasks(manifest, shifted_folder)
+    files = list(walk_files(song_histo_folder, '.pickle'))
+    song_histos = [pickle.load(open(_path + _name, 'rb')) for _path, _name in files]
+    # The keys and shifts of all songs in one call
+    shifts = kd.get_song_shifts(song_histos)
+    shift_midi = smf_rewrite.shift_midi_file if raw_midi_rewrite else mf.shift_midi
+    for (_path, _name), shift in zip(files, shifts.tolist()):
+        tempo_path = tempo_folder+_path[len(song_histo_folder):]
+        target_path = shifted_folder+_path[len(song_histo_folder):]
+        if shift >= 0:
+            if not os.path.exists(target_path):
+                os.makedirs(target_path)
+            tasks.add(shift_midi, (shift, _name[:-7], tempo_path, target_path), _name, file_errors,
+                      target_path + _name[:-7], [tempo_path + _name[:-7], _path + _name])
+    return tasks.run(jobs)
 
 
-def count_scales():
-    # get all scales for every root note
-    diatonic_scales, harmonic_scales, melodic_scales, blues_scales = get_scales()
+def shift_task(_path, _name, song_histo_folder, shifted_folder, tempo_folder):
+    # The shift of one song like shift_midi_files, None for the songs that are not shifted
+    shift = kd.get_song_shift(pickle.load(open(_path + _name, 'rb')))
+    if shift == 'other':
+        return None
+    shift_midi = smf_rewrite.shift_midi_file if raw_midi_rewrite else mf.shift_midi
+    tempo_path = tempo_folder+_path[len(song_histo_folder):]
+    target_path = shifted_folder+_path[len(song_histo_folder):]
+    if not os.path.exists(target_path):
+        os.makedirs(target_path)
+    return (shift_midi, (shift, _name[:-7], tempo_path, target_path), _name, file_errors,
+            target_path + _name[:-7], [tempo_path + _name[:-7], _path + _name])
+
 
+def count_scales():
     scale_cntr = Counter()
     other_cntr = Counter()
     for path, subdirs, files in os.walk(song_histo_folder):
@@ -95,18 +311,9 @@ def count_scales():
             _name = name.replace('\\', '/')
             song_histo = pickle.load(open(_path + _name, 'rb'))
             key = mf.histo_to_key(song_histo, key_n)
-            if key in diatonic_scales:
-                scale_cntr['diatonic'] +=1
-                          
-            elif key in harmonic_scales:
-                scale_cntr['harmonic'] +=1
-                          
-            elif key in melodic_scales:
-                scale_cntr['melodic'] +=1
-            elif key[:-1] in blues_scales:
-                scale_cntr['blues'] +=1
-            else:
-                scale_cntr['other'] += 1
+            family = kd.get_family(key)
+            scale_cntr[family] +=1
+            if family == 'other':
                 other_cntr[key] +=1
     return scale_cntr, other_cntr
     
@@ -126,27 +333,43 @@ def count_keys():
     return key_cntr
 
 
-def save_song_histo_from_histo(histo_folder,song_histo_folder):
-    for path, subdirs, files in os.walk(histo_folder):
-        for name in files:
-            _path = path.replace('\\', '/') + '/'
-            _name = name.replace('\\', '/')
-            target_path = song_histo_folder+_path[len(histo_folder):]
-            if not os.path.exists(target_path):
-                os.makedirs(target_path) 
-            mf.load_histo_save_song_histo(_name, _path, target_path)
+def count_estimated_keys():
+    # Counts the major and minor keys of the template key estimator
+    song_histos = [pickle.load(open(_path + _name, 'rb')) for _path, _name in walk_files(song_histo_folder, '.pickle')]
+    return Counter(kd.estimated_key_names(song_histos))
+
+
+def song_histo_task(_path, _name, histo_folder, song_histo_folder):
+    target_path = song_histo_folder+_path[len(histo_folder):]
+    if not os.path.exists(target_path):
+        os.makedirs(target_path) 
+    return (mf.load_histo_save_song_histo, (_name, _path, target_path), _name, (),
+            target_path + _name, [_path + _name])
+
 
+def save_song_histo_from_histo(histo_folder,song_histo_folder, manifest=None):
+    tasks = FileTasks(manifest, song_histo_folder)
+    for _path, _name in walk_files(histo_folder, '.pickle'):
+        tasks.add(*song_histo_task(_path, _name, histo_folder, song_histo_folder))
+    return tasks.run()
 
-def save_index_from_chords(chords_folder,chords_index_folder):
+
+def index_task(_path, _name, chords_folder, chords_index_folder, chord_to_index):
+    # The chord dict is an input of every index file, so they are only made
+    # again if the chords of the song or the vocabulary changed
+    target_path = chords_index_folder+_path[len(chords_folder):]
+    if not os.path.exists(target_path):
+        os.makedirs(target_path) 
+    return (mf.chords_to_index_save, (_name, _path, target_path, chord_to_index), _name, (),
+            target_path + _name, [_path + _name, dict_path + chord_dict_name])
+
+
+def save_index_from_chords(chords_folder,chords_index_folder, jobs=1, manifest=None):
     chord_to_index, index_to_chords = get_chord_dict()
-    for path, subdirs, files in os.walk(chords_folder):
-        for name in files:
-            _path = path.replace('\\', '/') + '/'
-            _name = name.replace('\\', '/')
-            target_path = chords_index_folder+_path[len(chords_folder):]
-            if not os.path.exists(target_path):
-                os.makedirs(target_path) 
-            mf.chords_to_index_save(_name, _path, target_path, chord_to_index)
+    tasks = FileTasks(manifest, chords_index_folder)
+    for _path, _name in walk_files(chords_folder, '.pickle'):
+        tasks.add(*index_task(_path, _name, chords_folder, chords_index_folder, chord_to_index))
+    return tasks.run(jobs)
 
 
 def get_chord_dict():
@@ -157,29 +380,169 @@ def get_chord_dict():
 
 def make_chord_dict(chords_folder, num_chords):
     cntr = count_chords(chords_folder, num_chords)
+    return save_chord_dict(cntr)
+
+
+def save_chord_dict(cntr, chord_dict_file=None, index_dict_file=None):
+    # Chord dict of the (chord, count) pairs of cntr, most common first, 0 is UNK
     chord_to_index = dict()
     chord_to_index[UNK] = 0
     for chord, _ in cntr:
         chord_to_index[chord] = len(chord_to_index)
+    return write_chord_dict(chord_to_index, chord_dict_file, index_dict_file)
+
+
+def write_chord_dict(chord_to_index, chord_dict_file=None, index_dict_file=None):
+    # Saved to the dicts of dict_path if no files are given
+    if chord_dict_file is None:
+        chord_dict_file = dict_path + chord_dict_name
+    if index_dict_file is None:
+        index_dict_file = dict_path + index_dict_name
     index_to_chord = {v: k for k, v in chord_to_index.items()}
-    pickle.dump(chord_to_index,open(dict_path + chord_dict_name , 'wb'))
-    pickle.dump(index_to_chord,open(dict_path + index_dict_name , 'wb'))
+    pickle.dump(chord_to_index,open(chord_dict_file , 'wb'))
+    pickle.dump(index_to_chord,open(index_dict_file , 'wb'))
     return chord_to_index, index_to_chord
 
 
 def count_chords(chords_folder, num_chords):
+    if chord_counter_capacity is not None:
+        return count_top_chords(chords_folder, num_chords, chord_counter_capacity)
+    return count_all_chords(chords_folder).most_common(n=num_chords-1)
+
+
+def count_top_chords(chords_folder, num_chords, capacity):
+    # The most common chords counted in capacity counters
+    cntr = space_saving.SpaceSaving(capacity)
+    for _path, _name in walk_files(chords_folder, '.pickle'):
+        cntr.update(pickle.load(open(_path + _name, 'rb')))
+    print(cntr.num_items, 'chords in', capacity, 'counters, counts at most', cntr.max_error(), 'too high,',
+          cntr.num_guaranteed(num_chords-1), 'of', num_chords-1, 'chords guaranteed in the vocabulary')
+    return cntr.most_common(num_chords-1)
+
+
+def count_all_chords(chords_folder):
     chord_cntr = Counter()
-    for path, subdirs, files in os.walk(chords_folder):
-        for name in files:
-            _path = path.replace('\\', '/') + '/'
-            _name = name.replace('\\', '/')
-            chords = pickle.load(open(_path + _name, 'rb'))
-            for chord in chords:
-                if chord in chord_cntr:
-                    chord_cntr[chord] +=1
-                else:
-                    chord_cntr[chord] = 1                    
-    return chord_cntr.most_common(n=num_chords-1)
+    for _path, _name in walk_files(chords_folder, '.pickle'):
+        chords = pickle.load(open(_path + _name, 'rb'))
+        for chord in chords:
+            if chord in chord_cntr:
+                chord_cntr[chord] +=1
+            else:
+                chord_cntr[chord] = 1                    
+    return chord_cntr
+
+
+def update_chord_dict_and_index(chords_folder, chords_index_folder, jobs=1, manifest=None, stable=False):
+    # make_chord_dict and save_index_from_chords from the chord counts of
+    # chord_vocabulary.py: only the new and changed songs are counted and
+    # only the songs with a chord whose index changed are indexed again
+    counts = chord_vocabulary.ChordCounts(dict_path + chord_counts_name)
+    songs = list(walk_files(chords_folder, '.pickle'))
+    changed, removed = counts.update(songs)
+    counts.save()
+    print(len(changed), 'songs counted,', len(removed), 'removed')
+
+    old_chord_to_index = None
+    if os.path.exists(dict_path + chord_dict_name):
+        old_chord_to_index, _ = get_chord_dict()
+    start = time.time()
+    cntr = counts.most_common(num_chords-1)
+    if stable and old_chord_to_index is not None:
+        chord_to_index = chord_vocabulary.stable_chord_dict(old_chord_to_index, cntr, num_chords)
+        missing = [chord for chord, _ in cntr if chord not in chord_to_index]
+        print(len(missing), 'of the', len(cntr), 'most common chords are not in the stable dict')
+        write_chord_dict(chord_to_index)
+    else:
+        chord_to_index, _ = save_chord_dict(cntr)
+    print('vocabulary made from the counts in %.1f ms' % (1000*(time.time() - start)))
+
+    for filepath in removed:
+        # The index sequences of removed songs would be loaded for training
+        index_file = chords_index_folder + filepath[len(chords_folder):]
+        if os.path.exists(index_file):
+            os.remove(index_file)
+        if manifest is not None:
+            manifest.forget(index_file)
+
+    if old_chord_to_index is None:
+        reindex = None
+    else:
+        reindex = set(changed)
+        reindex.update(counts.songs_with(chord_vocabulary.changed_chords(old_chord_to_index, chord_to_index)))
+    tasks = FileTasks(manifest)
+    for _path, _name in songs:
+        func, args, name, errors, output_file, input_files = index_task(
+            _path, _name, chords_folder, chords_index_folder, chord_to_index)
+        if reindex is None or _path + _name in reindex or not os.path.exists(output_file):
+            tasks.add(func, args, name, errors, output_file, input_files)
+        elif manifest is not None:
+            # The index sequence is the same with the new chord dict
+            manifest.record(output_file, input_files, func.__name__)
+    print(len(tasks.tasks), 'of', len(songs), 'songs are indexed again')
+    tasks.run(jobs)
+    return chord_to_index
+
+
+def shard_counts_path(index, count):
+    return dict_path + 'chord_counts_' + str(index) + '_of_' + str(count) + '.pickle'
+
+
+def save_shard_chord_counts(chords_folder):
+    # The chord counts of the songs of this shard, for merge_shards
+    print('counting the chords of shard', shard_index, 'of', num_shards)
+    pickle.dump(count_all_chords(chords_folder), open(shard_counts_path(shard_index, num_shards), 'wb'))
+
+
+def merge_chord_counts(counters):
+    # Adds up the chord counts of the shards. The chords are put in sorted
+    # order, so chords with the same count get the same indexes for any
+    # number and order of the shards.
+    total = Counter()
+    for counter in counters:
+        total.update(counter)
+    return Counter({chord: total[chord] for chord in sorted(total)})
+
+
+def merge_shards(count, shards=None, jobs=1, incremental=False):
+    # Makes the chord dict from the chord counts of count shards and the
+    # chord index sequences of the songs of shards (default all shards)
+    counters = [pickle.load(open(shard_counts_path(index, count), 'rb')) for index in range(count)]
+    print('getting dictionary of', count, 'shards')
+    save_chord_dict(merge_chord_counts(counters).most_common(n=num_chords-1))
+    previous_shard = shard_index, num_shards
+    try:
+        for index in (range(count) if shards is None else shards):
+            print('converting chords to index sequences of shard', index)
+            set_shard(index, count)
+            save_index_from_chords(chords_folder,chords_index_folder, jobs, get_manifest(incremental))
+    finally:
+        set_shard(*previous_shard)
+    if shards is None:
+        # Only the merge of all shards writes the state files of dict_path,
+        # the merges of single shards may run at the same time
+        merge_shard_state(count, incremental)
+
+
+def merge_shard_state(count, incremental):
+    # Merges the manifests and quarantines of count shards into the ones of
+    # dict_path, for the loaders and the runs without shards
+    if incremental:
+        manifest = Manifest(dict_path + manifest_name)
+        for index in range(count):
+            manifest.merge(Manifest(dict_path + shard_file_name(manifest_name, index, count)))
+        manifest.save()
+    if use_quarantine:
+        quarantine.merge_shard_quarantines(count)
+
+
+def run_local_shards(count, argv):
+    # Runs every shard in its own process like on count machines and merges
+    # them, argv are the other arguments of the shard runs
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--shard',
+                                   str(index) + '/' + str(count)] + argv) for index in range(count)]
+    for process in processes:
+        if process.wait() != 0:
+            raise RuntimeError('shard run failed with exit code ' + str(process.returncode))
 
 def count_chords2(chords_folder, num_chords):
     chord_cntr = Counter()
@@ -198,16 +561,60 @@ def count_chords2(chords_folder, num_chords):
 
 
 
-def save_chords_from_histo(histo_folder,chords_folder):
-    for path, subdirs, files in os.walk(histo_folder):
-        for name in files:
-            _path = path.replace('\\', '/') + '/'
-            _name = name.replace('\\', '/')
-            target_path = chords_folder+_path[len(histo_folder):]
-            if not os.path.exists(target_path):
-                os.makedirs(target_path) 
-            mf.load_histo_save_chords(chord_n, _name, _path, target_path)
+def chords_task(_path, _name, histo_folder, chords_folder):
+    target_path = chords_folder+_path[len(histo_folder):]
+    if not os.path.exists(target_path):
+        os.makedirs(target_path) 
+    return (mf.load_histo_save_chords, (chord_n, _name, _path, target_path), _name, (),
+            target_path + _name, [_path + _name])
+
+
+def save_chords_from_histo(histo_folder,chords_folder, jobs=1, manifest=None):
+    tasks = FileTasks(manifest, chords_folder)
+    for _path, _name in walk_files(histo_folder, '.pickle'):
+        tasks.add(*chords_task(_path, _name, histo_folder, chords_folder))
+    return tasks.run(jobs)
+
+
+
+def chord_masks_task(_path, _name, histo_folder, masks_folder):
+    target_path = masks_folder+_path[len(histo_folder):]
+    if not os.path.exists(target_path):
+        os.makedirs(target_path)
+    return (cm.load_histo_save_chord_masks, (chord_n, _name, _path, target_path), _name, (),
+            target_path + _name, [_path + _name])
+
 
+def save_chord_masks_from_histo(histo_folder,masks_folder, jobs=1, manifest=None):
+    tasks = FileTasks(manifest, masks_folder)
+    for _path, _name in walk_files(histo_folder, '.pickle'):
+        tasks.add(*chord_masks_task(_path, _name, histo_folder, masks_folder))
+    return tasks.run(jobs)
+
+
+def make_chord_dict_from_masks(masks_folder, num_chords):
+    # Same dict as make_chord_dict, counted with bincount over the chord masks
+    cntr = cm.MaskCounter()
+    for _path, _name in walk_files(masks_folder, '.pickle'):
+        cntr.add(pickle.load(open(_path + _name, 'rb')))
+    return save_chord_dict([(cm.mask_to_chord(mask), count) for mask, count in cntr.most_common(num_chords-1)])
+
+
+def mask_index_task(_path, _name, masks_folder, chords_index_folder, lookup):
+    target_path = chords_index_folder+_path[len(masks_folder):]
+    if not os.path.exists(target_path):
+        os.makedirs(target_path)
+    return (cm.chord_masks_to_index_save, (_name, _path, target_path, lookup), _name, (),
+            target_path + _name, [_path + _name, dict_path + chord_dict_name])
+
+
+def save_index_from_chord_masks(masks_folder,chords_index_folder, jobs=1, manifest=None):
+    chord_to_index, index_to_chords = get_chord_dict()
+    lookup = cm.chord_dict_to_lookup(chord_to_index)
+    tasks = FileTasks(manifest, chords_index_folder)
+    for _path, _name in walk_files(masks_folder, '.pickle'):
+        tasks.add(*mask_index_task(_path, _name, masks_folder, chords_index_folder, lookup))
+    return tasks.run(jobs)
 
 
 def save_histo_oct_from_pianoroll_folder():
@@ -222,95 +629,393 @@ def save_histo_oct_from_pianoroll_folder():
             mf.save_pianoroll_to_histo_oct(samples_per_bar,octave, _name, _path, target_path)
 
 
-def save_histo_oct_from_midi_folder(tempo_folder,histo_folder):
+def histo_task(_path, _name, tempo_folder, histo_folder):
+    target_path = histo_folder+_path[len(tempo_folder):]
+    if not os.path.exists(target_path):
+        os.makedirs(target_path)
+    return (mf.midi_to_histo_oct, (samples_per_bar, octave, fs, _name, _path, target_path), _name, file_errors,
+            target_path + _name + '.pickle', [_path + _name])
+
+
+def save_histo_oct_from_midi_folder(tempo_folder,histo_folder, jobs=1, manifest=None):
     print(tempo_folder)
-    for path, subdirs, files in os.walk(tempo_folder):
+    tasks = FileTasks(manifest, histo_folder)
+    for _path, _name in walk_files(tempo_folder):
+        tasks.add(*histo_task(_path, _name, tempo_folder, histo_folder))
+    return tasks.run(jobs)
 
-        for name in files:
-            _path = path.replace('\\', '/') + '/'
-            _name = name.replace('\\', '/')
-            target_path = histo_folder+_path[len(tempo_folder):]
-            if not os.path.exists(target_path):
-                os.makedirs(target_path)
-            try:
-                mf.midi_to_histo_oct(samples_per_bar, octave, fs, _name, _path, target_path)
-            except (ValueError, EOFError, IndexError, OSError, KeyError, ZeroDivisionError) as e:
-                exception_str = 'Unexpected error in ' + name  + ':\n', e, sys.exc_info()[0]
-                print(exception_str)
-#                invalid_files_counter +=1
 
 
+def note_ind_task(_path, _name, tempo_folder, roll_folder):
+    target_path = roll_folder+_path[len(tempo_folder):]
+    if not os.path.exists(target_path):
+        os.makedirs(target_path)
+    return (mf.save_note_ind, (_name, _path, target_path, fs), _name, file_errors,
+            target_path + _name + '.pickle', [_path + _name])
 
-def note_ind_folder(tempo_folder,roll_folder):
-    for path, subdirs, files in os.walk(tempo_folder):
-        for name in files:
-            _path = path.replace('\\', '/') + '/'
-            _name = name.replace('\\', '/')
-            target_path = roll_folder+_path[len(tempo_folder):]
-            if not os.path.exists(target_path):
-                os.makedirs(target_path)
-            try:
-                mf.save_note_ind(_name, _path, target_path, fs)
-            except (ValueError, EOFError, IndexError, OSError, KeyError, ZeroDivisionError) as e:
-                exception_str = 'Unexpected error in ' + name  + ':\n', e, sys.exc_info()[0]
-                print(exception_str)
-#                invalid_files_counter +=1
-
-def change_tempo_folder(source_folder,tempo_folder):
-    # midi_data_path = pickle.load(open('midi_data_paths.pkl', 'rb'))
-    for path, subdirs, files in os.walk(source_folder):
-        for name in files:
-            print('name: ', name)
-            # if os.path.join(path, name) not in midi_data_path:
-            #     continue
 
-            _path = path.replace('\\', '/') + '/'
-            _name = name.replace('\\', '/')
-            target_path = tempo_folder+_path[len(source_folder):]
+def note_ind_folder(tempo_folder,roll_folder, jobs=1, manifest=None):
+    tasks = FileTasks(manifest, roll_folder)
+    for _path, _name in walk_files(tempo_folder):
+        tasks.add(*note_ind_task(_path, _name, tempo_folder, roll_folder))
+    return tasks.run(jobs)
 
+def tempo_task(_path, _name, source_folder, tempo_folder):
+    change_tempo = mf.change_tempo
+    if raw_midi_rewrite and not (discretize_time or offset_time):
+        change_tempo = smf_rewrite.change_tempo_file
+    target_path = tempo_folder+_path[len(source_folder):]
+
+    if not os.path.exists(target_path):
+        os.makedirs(target_path)
+    return (change_tempo, (_name, _path, target_path), _name, file_errors + (AttributeError, IOError),
+            target_path + _name, [_path + _name])
+
+
+def change_tempo_folder(source_folder,tempo_folder, jobs=1, manifest=None):
+    tasks = FileTasks(manifest, tempo_folder)
+    for _path, _name in walk_files(source_folder):
+        tasks.add(*tempo_task(_path, _name, source_folder, tempo_folder))
+    return tasks.run(jobs)
+
+def cache_notes_folder(folder, jobs=1):
+    # Parses every MIDI file of the folder into note_cache_folder
+    tasks = []
+    for _path, _name in walk_folder(folder):
+        if note_cache.load_cached_midi(_path + _name) is None:
+            tasks.append((note_cache.cache_midi, (_path + _name,), _name, file_errors + (AttributeError, IOError)))
+    run_file_tasks(tasks, jobs)
+
+
+def fused_song(name, path, algebraic_shift, song_histo_path, roll_path, chords_path,
+               tempo_path1=None, histo_path1=None, tempo_path2=None, histo_path2=None):
+    # Does the tempo change, histogramming, shifting, note indexing and chord
+    # extraction of one song in memory with a single parse of the MIDI file.
+    # The intermediate files are only written if their paths are given.
+    # With algebraic_shift the shifted note index and histogram are derived
+    # from the unshifted piano roll instead of rolling the shifted song again.
+    mid = mido.MidiFile(path + name)
+    mf.change_tempo_in_place(mid)
+    if tempo_path1 is not None:
+        mid.save(tempo_path1 + name)
+    midi = pm.PrettyMIDI(mido_object=mid)
+
+    pianoroll = mf.get_pianoroll_from_midi(midi, fs)
+    histo_bar = mf.pianoroll_to_histo_bar(pianoroll, samples_per_bar)
+    histo_oct = mf.histo_bar_to_histo_oct(histo_bar, octave)
+    if histo_path1 is not None:
+        pickle.dump(histo_oct, open(histo_path1 + name + '.pickle', 'wb'))
+    song_histo = np.sum(histo_oct, axis=1)
+    pickle.dump(song_histo, open(song_histo_path + name + '.pickle', 'wb'))
+
+    shift = kd.get_song_shift(song_histo)
+    if shift == 'other':
+        return shift
+    if algebraic_shift:
+        mf.check_shift(midi, shift)
+        # Bent notes near the highest or lowest pitch need the roll of the shifted song
+        algebraic_shift = mf.shift_keeps_roll(midi, shift)
+    if algebraic_shift:
+        note_ind = mf.shift_note_index(mf.pianoroll_to_note_index(pianoroll), shift)
+        histo_oct = mf.histo_bar_to_histo_oct(mf.shift_histo_bar(histo_bar, shift), octave)
+    if tempo_path2 is not None or not algebraic_shift:
+        mf.shift_pretty_midi(midi, shift)
+    if tempo_path2 is not None:
+        midi.write(tempo_path2 + name)
+    if not algebraic_shift:
+        pianoroll = mf.get_pianoroll_from_midi(midi, fs)
+        note_ind = mf.pianoroll_to_note_index(pianoroll)
+        histo_oct = mf.pianoroll_to_histo_oct(pianoroll, samples_per_bar, octave)
+
+    pickle.dump(note_ind, open(roll_path + name + '.pickle', 'wb'))
+    if histo_path2 is not None:
+        pickle.dump(histo_oct, open(histo_path2 + name + '.pickle', 'wb'))
+    pickle.dump(mf.histo_to_chords(histo_oct, chord_n), open(chords_path + name + '.pickle', 'wb'))
+    return shift
+
+
+def fused_folder(source_folder, keep_intermediate=False, algebraic_shift=False, jobs=1, manifest=None):
+    # The song histogram is the output file of a song, the other files are
+    # extra outputs, so the ones of removed and unshifted songs are deleted
+    folders = [song_histo_folder, roll_folder, chords_folder]
+    if keep_intermediate:
+        folders += [tempo_folder1, histo_folder1, tempo_folder2, histo_folder2]
+    tasks = FileTasks(manifest, folders)
+    for _path, _name in walk_files(source_folder):
+        sub_path = _path[len(source_folder):]
+        target_paths = [folder + sub_path for folder in folders]
+        for target_path in target_paths:
             if not os.path.exists(target_path):
                 os.makedirs(target_path)
-            try:
-                mf.change_tempo(_name, _path, target_path)
-            except (ValueError, EOFError, IndexError, OSError, KeyError, ZeroDivisionError, AttributeError, IOError) as e:
-                exception_str = 'Unexpected error in ' + name  + ':\n', e, sys.exc_info()[0]
-                print(exception_str)
-#                invalid_files_counter +=1
-
-def do_all_steps():
-    
+        # The tempo changed files keep the name of the MIDI file
+        outputs = [target_path + _name + ('' if folder in (tempo_folder1, tempo_folder2) else '.pickle')
+                   for folder, target_path in zip(folders, target_paths)]
+        tasks.add(fused_song, tuple([_name, _path, algebraic_shift] + target_paths), _name,
+                  file_errors + (AttributeError, IOError), outputs[0], [_path + _name], outputs[1:])
+    return tasks.run(jobs)
+
+
+def get_manifest(incremental):
+    # A shard process keeps its own manifest, see merge_shard_state
+    if incremental:
+        if num_shards > 1:
+            return Manifest(dict_path + shard_file_name(manifest_name, shard_index, num_shards))
+        return Manifest(dict_path + manifest_name)
+    return None
+
+
+def do_all_steps_fused(jobs=1, keep_intermediate=False, algebraic_shift=False, incremental=False):
+    manifest = get_manifest(incremental)
+
+    print('processing songs')
+    fused_folder(source_folder, keep_intermediate, algebraic_shift, jobs, manifest)
+    if num_shards > 1:
+        save_shard_chord_counts(chords_folder)
+        return
+    if incremental_vocabulary:
+        print('updating dictionary and index sequences')
+        update_chord_dict_and_index(chords_folder, chords_index_folder, jobs, manifest, stable_vocabulary)
+        return
+
+    print('getting dictionary')
+    chord_to_index, index_to_chord = make_chord_dict(chords_folder, num_chords)
+
+    print('converting chords to index sequences')
+    save_index_from_chords(chords_folder,chords_index_folder, jobs, manifest)
+
+
+def compare_pickle_folders(folder1, folder2):
+    # Checks that two processed folders contain the same songs with equal pickles
+    mismatches = []
+    for _path, _name in walk_folder(folder1):
+        if not _name.endswith('.pickle'):
+            continue
+        other_path = folder2 + _path[len(folder1):]
+        if not os.path.exists(other_path + _name):
+            mismatches.append(_path + _name)
+            continue
+        x = pickle.load(open(_path + _name, 'rb'))
+        y = pickle.load(open(other_path + _name, 'rb'))
+        if isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+            equal = np.array_equal(x, y)
+        else:
+            equal = x == y
+        if not equal:
+            mismatches.append(_path + _name)
+    print(len(mismatches), 'of', len(list(walk_folder(folder1))), 'files in', folder1, 'differ or are missing')
+    return mismatches
+
+
+def do_all_steps(jobs=1, incremental=False, chord_masks=False):
+    manifest = get_manifest(incremental)
 
     print('changing Tempo')
-    # change_tempo_folder(source_folder,tempo_folder1)
+    change_tempo_folder(source_folder,tempo_folder1, jobs, manifest)
     
     print('histogramming')
-    # save_histo_oct_from_midi_folder(tempo_folder1,histo_folder1)
+    save_histo_oct_from_midi_folder(tempo_folder1,histo_folder1, jobs, manifest)
    
     print('make song histo')
-    # save_song_histo_from_histo(histo_folder1,song_histo_folder)
+    save_song_histo_from_histo(histo_folder1,song_histo_folder, manifest)
     
     print('shifting midi files')
-    # shift_midi_files(song_histo_folder,tempo_folder1,tempo_folder2)
+    shift_midi_files(song_histo_folder,tempo_folder1,tempo_folder2, jobs, manifest)
     
     
     print('making note indexes')
-    # note_ind_folder(tempo_folder2,roll_folder)
+    note_ind_folder(tempo_folder2,roll_folder, jobs, manifest)
     
     print('histogramming')
-    save_histo_oct_from_midi_folder(tempo_folder2,histo_folder2)
+    save_histo_oct_from_midi_folder(tempo_folder2,histo_folder2, jobs, manifest)
     
+    if chord_masks:
+        print('extracting chord masks')
+        save_chord_masks_from_histo(histo_folder2,chord_masks_folder, jobs, manifest)
+
+        print('getting dictionary')
+        chord_to_index, index_to_chord = make_chord_dict_from_masks(chord_masks_folder, num_chords)
+
+        print('converting chord masks to index sequences')
+        save_index_from_chord_masks(chord_masks_folder,chords_index_folder, jobs, manifest)
+        return
+
     print('extracting chords')
-    save_chords_from_histo(histo_folder2,chords_folder)
+    save_chords_from_histo(histo_folder2,chords_folder, jobs, manifest)
+    if num_shards > 1:
+        save_shard_chord_counts(chords_folder)
+        return
+    if incremental_vocabulary:
+        print('updating dictionary and index sequences')
+        update_chord_dict_and_index(chords_folder, chords_index_folder, jobs, manifest, stable_vocabulary)
+        return
     
     print('getting dictionary')
     chord_to_index, index_to_chord = make_chord_dict(chords_folder, num_chords)
 
     print('converting chords to index sequences')
-    save_index_from_chords(chords_folder,chords_index_folder)
+    save_index_from_chords(chords_folder,chords_index_folder, jobs, manifest)
+
+
+def do_all_steps_pipelined(jobs=1, incremental=False, chord_masks=False):
+    # The stages of do_all_steps, but a song goes on to its next stage as soon
+    # as its files of the stage before exist (stage_scheduler.py). Only the
+    # chord dictionary waits for all songs. Every stage has a pool of
+    # stage_jobs[stage] or jobs workers, supervised by file_watchdog.py if
+    # file_timeout or file_memory_limit is set.
+    manifest = get_manifest(incremental)
+    supervised = file_timeout is not None or file_memory_limit is not None
+
+    def make_pool(jobs):
+        if supervised:
+            return file_watchdog.SupervisedPool(jobs, file_timeout, file_memory_limit)
+        return multiprocessing.Pool(jobs)
+
+    def stage(name, make_task, in_folder, out_folder, suffix='', upstream=None):
+        stage_num_jobs = stage_jobs.get(name, jobs)
+        if supervised:
+            # The tasks of the main process can not be supervised
+            stage_num_jobs = max(stage_num_jobs, 1)
+        return stage_scheduler.Stage(name, make_task, in_folder, out_folder, FileTasks(manifest, out_folder), suffix,
+                                     upstream, stage_num_jobs)
+
+    def shift(_path, _name, song_histo_folder, shifted_folder):
+        return shift_task(_path, _name, song_histo_folder, shifted_folder, tempo_folder1)
+
+    stages = [stage('tempo', tempo_task, source_folder, tempo_folder1),
+              stage('histo', histo_task, tempo_folder1, histo_folder1, '', 'tempo'),
+              stage('song_histo', song_histo_task, histo_folder1, song_histo_folder, '.pickle', 'histo'),
+              stage('shift', shift, song_histo_folder, tempo_folder2, '.pickle', 'song_histo'),
+              stage('note_ind', note_ind_task, tempo_folder2, roll_folder, '', 'shift'),
+              stage('histo2', histo_task, tempo_folder2, histo_folder2, '', 'shift')]
+    if chord_masks:
+        stages.append(stage('chord_masks', chord_masks_task, histo_folder2, chord_masks_folder, '.pickle', 'histo2'))
+    else:
+        stages.append(stage('chords', chords_task, histo_folder2, chords_folder, '.pickle', 'histo2'))
+    songs = [(_path[len(source_folder):], _name) for _path, _name in walk_files(source_folder)]
+
+    print('processing songs')
+    stage_scheduler.run_stages(stages, songs, run_file_task, make_pool)
+    report_stages(stages)
+    if num_shards > 1:
+        save_shard_chord_counts(chords_folder)
+        return
+    if incremental_vocabulary and not chord_masks:
+        print('updating dictionary and index sequences')
+        update_chord_dict_and_index(chords_folder, chords_index_folder, jobs, manifest, stable_vocabulary)
+        return
+
+    print('getting dictionary')
+    if chord_masks:
+        chord_to_index, index_to_chord = make_chord_dict_from_masks(chord_masks_folder, num_chords)
+        lookup = cm.chord_dict_to_lookup(chord_to_index)
+        index = stage('index', lambda _path, _name, masks_folder, index_folder:
+                      mask_index_task(_path, _name, masks_folder, index_folder, lookup),
+                      chord_masks_folder, chords_index_folder, '.pickle')
+    else:
+        chord_to_index, index_to_chord = make_chord_dict(chords_folder, num_chords)
+        index = stage('index', lambda _path, _name, chords_folder, index_folder:
+                      index_task(_path, _name, chords_folder, index_folder, chord_to_index),
+                      chords_folder, chords_index_folder, '.pickle')
+
+    print('converting chords to index sequences')
+    stage_scheduler.run_stages([index], songs, run_file_task, make_pool)
+    report_stages([index])
+
+
+def report_stages(stages):
+    for stage in stages:
+        file_tasks = stage.file_tasks
+        if stage.failed or file_tasks.num_skipped or file_tasks.num_quarantined or file_tasks.num_removed:
+            print(stage.name)
+        file_tasks.print_skipped()
+        file_tasks.print_removed()
+        report_errors(stage.failed, stage.num_tasks)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Preprocess the MIDI dataset for JamBot.')
+    parser.add_argument('--jobs', type=int, default=num_jobs,
+                        help='number of worker processes for the per file stages')
+    parser.add_argument('--fused', action='store_true',
+                        help='parse every song only once and do all per song stages in memory')
+    parser.add_argument('--keep-intermediate', action='store_true',
+                        help='also write the tempo and histo folders in the fused mode')
+    parser.add_argument('--algebraic-shift', action='store_true',
+                        help='derive the shifted note indexes and histograms from the unshifted song in the fused mode')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only process the files that changed since the last run, see manifest.py')
+    parser.add_argument('--chord-masks', action='store_true',
+                        help='extract the chords as pitch class bitmasks into chord_masks_folder, see chord_masks.py')
+    parser.add_argument('--pack', action='store_true',
+                        help='pack the note indexes and chord indexes into the shards of packed_folder at the end')
+    parser.add_argument('--compare', nargs=2, metavar=('FOLDER1', 'FOLDER2'),
+                        help='only compare the pickles of two processed folders')
+    parser.add_argument('--cache-notes', metavar='FOLDER',
+                        help='only parse the MIDI files of FOLDER into note_cache_folder, see note_cache.py')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='start the next stage of a song as soon as its files exist instead of after the whole stage')
+    parser.add_argument('--stage-jobs', nargs='*', default=[], metavar='STAGE=N',
+                        help='worker processes of single stages in the pipelined run, like histo=4')
+    parser.add_argument('--shard', metavar='I/N',
+                        help='only process the songs of shard I of N and save their chord counts for --merge-shards')
+    parser.add_argument('--merge-shards', type=int, metavar='N',
+                        help='make the chord dict from the chord counts of N shards and the index sequences '
+                             'of all shards, or only of the shard of --shard')
+    parser.add_argument('--local-shards', type=int, metavar='N',
+                        help='run N shards in N local processes and merge them')
+    parser.add_argument('--retry-quarantined', action='store_true',
+                        help='process the quarantined files again, see quarantine.py')
+    parser.add_argument('--file-timeout', type=float, default=file_timeout,
+                        help='stop a worker that takes longer than this many seconds for a file')
+    parser.add_argument('--file-memory-limit', type=int, default=file_memory_limit,
+                        help='limit the address space of the workers to this many bytes')
+    parser.add_argument('--incremental-vocabulary', action='store_true', default=incremental_vocabulary,
+                        help='update the chord dict from the chord counts of the changed songs, see chord_vocabulary.py')
+    parser.add_argument('--stable-vocabulary', action='store_true', default=stable_vocabulary,
+                        help='keep the indexes of the chords of the current chord dict with --incremental-vocabulary')
+    args = parser.parse_args()
+    if args.chord_masks and (args.shard or args.merge_shards or args.local_shards):
+        parser.error('the shards only count chords, not chord masks')
+    if args.chord_masks and (args.incremental_vocabulary or args.stable_vocabulary):
+        parser.error('the incremental vocabulary only counts chords, not chord masks')
+    if args.fused and args.chord_masks:
+        parser.error('the fused mode extracts chords, not chord masks')
+    return args
 
 
 if __name__=="__main__":
-    do_all_steps()
+    args = parse_args()
+    file_timeout = args.file_timeout
+    file_memory_limit = args.file_memory_limit
+    incremental_vocabulary = args.incremental_vocabulary
+    stable_vocabulary = args.stable_vocabulary
+    if args.shard:
+        set_shard(*[int(n) for n in args.shard.split('/')])
+    if args.retry_quarantined and quarantine.get_quarantine() is not None:
+        print(quarantine.get_quarantine().release(), 'quarantined files are processed again')
+        quarantine.get_quarantine().save()
+    if args.compare:
+        compare_pickle_folders(args.compare[0], args.compare[1])
+    elif args.cache_notes:
+        cache_notes_folder(args.cache_notes, args.jobs)
+    elif args.merge_shards:
+        merge_shards(args.merge_shards, [shard_index] if args.shard else None, args.jobs, args.incremental)
+    elif args.local_shards:
+        argv = sys.argv[1:]
+        i = argv.index('--local-shards')
+        run_local_shards(args.local_shards, argv[:i] + argv[i+2:])
+        merge_shards(args.local_shards, None, args.jobs, args.incremental)
+    elif args.fused:
+        do_all_steps_fused(args.jobs, args.keep_intermediate, args.algebraic_shift, args.incremental)
+    elif args.pipeline:
+        stage_jobs = dict(stage_jobs, **{name: int(n) for name, n in
+                                         (stage_job.split('=') for stage_job in args.stage_jobs)})
+        do_all_steps_pipelined(args.jobs, args.incremental, args.chord_masks)
+    else:
+        do_all_steps(args.jobs, args.incremental, args.chord_masks)
+    if args.pack and not (args.compare or args.cache_notes or args.shard):
+        print('packing note and chord indexes')
+        packed_data.pack_ind_data_set(roll_folder, chords_index_folder, packed_folder)
 #    key_counter2 = count_keys()
 #    scale_counter2, other_counter2 = count_scales()
 #    shift_midi_files()
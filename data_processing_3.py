@@ -10,6 +10,7 @@ from collections import Counter
 import json
 from scipy.sparse import csc_matrix
 from midi_functions import *
+import lakh_pianorolls
 
 
 def msd_id_to_dirs(msd_id):
@@ -66,68 +67,14 @@ def get_dirs(base_dir):
     return dirs
 
 
-def testttt(path):
-    chord_cntr = Counter()
-
-    # make chord for each path
+def testttt(path, jobs=1):
+    # make chord for each path, the piano rolls are loaded sparse and the
+    # chords streamed to disk between the passes, see lakh_pianorolls.py
     paths = get_dirs(path)
     # paths = ['/home/wan/Documents/projects/data_processed/test_lmd_processed/A/A/A/TRAAAGR128F425B14B/5dd29e99ed7bd3cc0c5177a6e9de22ea',
     #          '/home/wan/Documents/projects/data_processed/test_lmd_processed/A/A/M/TRAAMBM128F4248306/7e1f7b9134e07ec789e2b2c2f3cbe7c5']
     print(paths[0])
-    chord_dict = {}
-    for _path in paths:
-        filepath = os.path.join(_path, 'piano_rolls.npz')
-
-        pianorolls = load_npz(filepath)
-
-        idx = 0
-        for track_num, track in pianorolls.items():
-            track_arr = track.toarray()
-            if idx == 0:
-                total = np.zeros_like(track_arr)
-                idx += 1
-
-            total += track_arr
-
-        total[total > 0] = 1
-
-        total = np.transpose(total)
-        histo_bar = pianoroll_to_histo_bar(total, samples_per_bar)
-        histo_oct = histo_bar_to_histo_oct(histo_bar, octave)
-        chords = histo_to_chords(histo_oct, chord_n)
-
-        for chord in chords:
-            if chord in chord_cntr:
-                chord_cntr[chord] += 1
-            else:
-                chord_cntr[chord] = 1
-
-        chord_dict[_path] = chords
-
-    # make chord dict
-    cntr = chord_cntr.most_common(n=num_chords - 1)
-
-    chord_to_index = dict()
-    chord_to_index[UNK] = 0
-    for chord, _ in cntr:
-        chord_to_index[chord] = len(chord_to_index)
-    index_to_chord = {v: k for k, v in chord_to_index.items()}
-    pickle.dump(chord_to_index, open(path + '/chord_to_index.pkl', 'wb'))
-    pickle.dump(index_to_chord, open(path + '/index_to_chord.pkl', 'wb'))
-
-    # make jambot style chord for each midi
-    for _path in paths:
-        chords = chord_dict[_path]
-
-        chords_index = []
-        for chord in chords:
-            if chord in chord_to_index:
-                chords_index.append(chord_to_index[chord])
-            else:
-                chords_index.append(chord_to_index[UNK])
-
-        with open(_path+'/jambot_chord.pkl', 'wb') as f:
-            pickle.dump(chords_index, f)
+    lakh_pianorolls.make_chord_indexes(path, paths, jobs)
 
 
 def get_scales():
@@ -404,7 +351,7 @@ if __name__=="__main__":
 #    pickle.dump(histo, open('histo_all_songs.pickle', 'wb'))
 #    chord_counter = count_chords(chords_folder, num_chords)
 #     testttt('/home/wan/Documents/projects/data_processed/test_lmd_processed')
-    testttt('/data1/lakh/lmd_matched_processed_ckey_melody_labeled_with_logger_0201')
+    testttt('/data1/lakh/lmd_matched_processed_ckey_melody_labeled_with_logger_0201', num_jobs)
     print('done')
 
 
@@ -0,0 +1,180 @@
+from settings import *
+import numpy as np
+import note_cache
+import corpus_index
+import data_processing as dp
+import hashlib
+import os
+import sys
+import time
+import argparse
+from collections import defaultdict
+
+
+'''
+Deduplication of the songs of the corpus before processing.
+
+Many MSD tracks of the Lakh MIDI dataset are matched to several MIDI files
+with the same or nearly the same notes. Every file gets a hash of its notes
+(pitch, start, end, program and drums, without the velocities and the order
+of the instruments and events), and of every group of files with the same
+hash only the first is kept. With dedup_signature the files of one MSD track
+are also compared by their pitch class histogram ('histo') or the set of
+their note onsets ('onsets') and a file is dropped if it is at least
+dedup_threshold similar to a file that is kept. The kept songs are saved as
+a corpus index, with use_dedup_index all stages only process these songs.
+'''
+
+
+def note_content(midi):
+    # The notes of a song in a canonical order, the times rounded to ms
+    if isinstance(midi, note_cache.CachedMidi):
+        notes = midi.notes
+    else:
+        notes, _ = note_cache.midi_to_tables(midi)
+    content = np.stack([np.round(notes['start']*1000), np.round(notes['end']*1000), notes['pitch'],
+                        notes['program'], notes['is_drum']], axis=1).astype(np.int64)
+    return content[np.lexsort(content.T[::-1])], notes
+
+
+def histo_signature(notes):
+    # Pitch class histogram of the note durations without the drums
+    notes = notes[~notes['is_drum']]
+    return np.bincount(notes['pitch'] % octave, weights=notes['end'] - notes['start'], minlength=octave)
+
+
+def onsets_signature(notes):
+    # Onsets of the notes without the drums on the grid of fs samples per second
+    notes = notes[~notes['is_drum']]
+    return np.unique(np.round(notes['start']*fs).astype(np.int64))
+
+
+signatures = {'histo': histo_signature, 'onsets': onsets_signature}
+
+
+def similarity(signature, x, y):
+    if signature == 'histo':
+        norm = np.linalg.norm(x)*np.linalg.norm(y)
+        return x.dot(y)/norm if norm > 0 else 0.
+    union = len(np.union1d(x, y))
+    return len(np.intersect1d(x, y))/union if union > 0 else 0.
+
+
+def fingerprint(filepath, signature=None):
+    # (note hash, number of notes, end time, signature) of a song
+    midi = note_cache.read_midi(filepath)
+    content, notes = note_content(midi)
+    content_hash = hashlib.md5(content.tobytes()).hexdigest()
+    end_time = float(notes['end'].max()) if len(notes) else 0.
+    song_signature = signatures[signature](notes) if signature is not None else None
+    return content_hash, len(notes), end_time, song_signature
+
+
+def fingerprint_chunk(task):
+    # Fingerprints of the files of a chunk, None for the files that can not
+    # be read, and the errors of these files
+    filepaths, signature = task
+    results = []
+    failed = []
+    for filepath in filepaths:
+        try:
+            results.append(fingerprint(filepath, signature))
+        except dp.file_errors + (AttributeError, IOError) as e:
+            failed.append(('Unexpected error in ' + filepath + ':\n', str(e), str(sys.exc_info()[0])))
+            results.append(None)
+    return results, failed
+
+
+def find_duplicates(filepaths, fingerprints, signature=None, threshold=dedup_threshold):
+    # Returns the index of the kept file for every duplicate file. Files that
+    # can not be read and songs without notes are never duplicates.
+    duplicates = dict()
+    first = dict()
+    for i, result in enumerate(fingerprints):
+        if result is None or result[1] == 0:
+            continue
+        if result[0] in first:
+            duplicates[i] = first[result[0]]
+        else:
+            first[result[0]] = i
+    if signature is None:
+        return duplicates
+    # Near duplicates are only searched among the files of the same MSD track
+    tracks = defaultdict(list)
+    for i in sorted(first.values()):
+        tracks[os.path.basename(os.path.dirname(filepaths[i]))].append(i)
+    for track_files in tracks.values():
+        kept = []
+        for i in track_files:
+            for j in kept:
+                if similarity(signature, fingerprints[i][3], fingerprints[j][3]) >= threshold:
+                    duplicates[i] = j
+                    break
+            else:
+                kept.append(i)
+    return duplicates
+
+
+def make_report(fingerprints, duplicates, signature, seconds):
+    # Number of files and share of the notes and the music the stages after
+    # the deduplication do not have to process
+    read = [result for result in fingerprints if result is not None]
+    exact = [i for i, j in duplicates.items() if fingerprints[i][0] == fingerprints[j][0]]
+    notes = sum(result[1] for result in read)
+    duration = sum(result[2] for result in read)
+    return {
+        'files': len(fingerprints),
+        'unreadable': len(fingerprints) - len(read),
+        'exact_duplicates': len(exact),
+        'near_duplicates': len(duplicates) - len(exact),
+        'signature': signature,
+        'kept': len(fingerprints) - len(duplicates),
+        'saved_files': len(duplicates)/max(len(fingerprints), 1),
+        'saved_notes': sum(fingerprints[i][1] for i in duplicates)/max(notes, 1),
+        'saved_hours': sum(fingerprints[i][2] for i in duplicates)/3600,
+        'saved_duration': sum(fingerprints[i][2] for i in duplicates)/max(duration, 1.),
+        'seconds': seconds,
+    }
+
+
+def print_report(report):
+    print(report['files'], 'files,', report['unreadable'], 'can not be read')
+    print(report['exact_duplicates'], 'exact duplicates,', report['near_duplicates'],
+          'near duplicates with signature', report['signature'])
+    print(report['kept'], 'files kept')
+    print('saved: %.1f%% of the files, %.1f%% of the notes, %.1f h (%.1f%%) of music'
+          % (100*report['saved_files'], 100*report['saved_notes'], report['saved_hours'],
+             100*report['saved_duration']))
+    print('deduplication took %.1f s' % report['seconds'])
+
+
+def dedup_folder(folder, signature=dedup_signature, threshold=dedup_threshold, jobs=1, chunk_size=256):
+    # Returns the corpus index of the songs of the folder that are kept and the report
+    start = time.time()
+    if use_corpus_index:
+        files = corpus_index.load_corpus_index().files(folder)
+    else:
+        files = dp.walk_folder(folder)
+    filepaths = sorted(_path + _name for _path, _name in files)
+    tasks = [(filepaths[i:i+chunk_size], signature) for i in range(0, len(filepaths), chunk_size)]
+    chunks = list(dp.imap_jobs(fingerprint_chunk, tasks, jobs))
+    fingerprints = [result for chunk, _ in chunks for result in chunk]
+    dp.report_errors([error for _, chunk_failed in chunks for error in chunk_failed], len(filepaths))
+    duplicates = find_duplicates(filepaths, fingerprints, signature, threshold)
+    kept = [filepath for i, filepath in enumerate(filepaths) if i not in duplicates]
+    report = make_report(fingerprints, duplicates, signature, time.time() - start)
+    return corpus_index.CorpusIndex.from_paths(kept, folder), report
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Find the duplicate songs of the corpus.')
+    parser.add_argument('folder', nargs='?', default=source_folder)
+    parser.add_argument('--signature', choices=sorted(signatures), default=dedup_signature,
+                        help='also drop near duplicates of the same MSD track by this signature')
+    parser.add_argument('--threshold', type=float, default=dedup_threshold)
+    parser.add_argument('--jobs', type=int, default=num_jobs)
+    parser.add_argument('--output', default=dedup_index_path)
+    args = parser.parse_args()
+    index, report = dedup_folder(args.folder, args.signature, args.threshold, args.jobs)
+    index.save(args.output)
+    print_report(report)
@@ -0,0 +1,204 @@
+import multiprocessing
+from multiprocessing.connection import wait
+from collections import deque
+import resource
+import threading
+import time
+
+
+'''
+Supervised execution of the per file tasks of data_processing.
+
+Every worker process runs one task at a time and gets the next one from
+the supervisor. A worker that takes longer than timeout seconds for a file
+is killed and replaced, and with memory_limit the address space of the
+workers is limited, so a file that needs more memory fails with a
+MemoryError instead of taking the memory of the whole machine. A worker
+that ran out of memory or died is replaced as well. The files are reported
+as failed with the same error tuples as run_file_task, so the run goes on
+and the stage finishes in a predictable time. SupervisedPool runs the
+workers for the pipelined stages of stage_scheduler.py, which submit their
+tasks one at a time.
+'''
+
+
+def worker_loop(conn, run_task, memory_limit):
+    if memory_limit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        try:
+            result = run_task(task)
+            recycle = False
+        except MemoryError:
+            result = failure(task, 'Memory limit of ' + str(memory_limit) + ' bytes exceeded', MemoryError)
+            recycle = True
+        conn.send((result, recycle))
+        if recycle:
+            break
+
+
+def failure(task, message, exception_class):
+    # Error tuple like run_file_task for a task that was stopped
+    _, _, name, _ = task
+    return 'Unexpected error in ' + name  + ':\n', message, str(exception_class)
+
+
+class Worker:
+    'worker process with the task it is running'
+    def __init__(self, run_task, memory_limit):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker_loop, args=(child_conn, run_task, memory_limit))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.task_index = None
+        self.task = None
+        self.started = None
+
+    def start(self, task_index, task):
+        self.task_index = task_index
+        self.task = task
+        self.started = time.time()
+        self.conn.send(task)
+
+    def result(self, ready, timeout):
+        # (result, recycle) of the running task, None while it is still running
+        if self.conn in ready:
+            try:
+                return self.conn.recv()
+            except EOFError:
+                # The worker died, like from the out of memory killer
+                self.process.join()
+                return failure(self.task, 'Worker died with exit code ' + str(self.process.exitcode),
+                               ChildProcessError), True
+        if timeout is not None and time.time() - self.started >= timeout:
+            return failure(self.task, 'No result after ' + str(timeout) + ' s, the worker was stopped',
+                           TimeoutError), True
+        return None
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join()
+        self.conn.close()
+
+
+def run_supervised_tasks(run_task, tasks, jobs=1, timeout=None, memory_limit=None):
+    # Runs run_task on every task in jobs supervised workers and returns the
+    # results in the order of the tasks
+    results = [None]*len(tasks)
+    pending = deque(range(len(tasks)))
+    idle = []
+    busy = []
+    num_restarted = 0
+    while pending or busy:
+        while pending and len(busy) < jobs:
+            worker = idle.pop() if idle else Worker(run_task, memory_limit)
+            task_index = pending.popleft()
+            worker.start(task_index, tasks[task_index])
+            busy.append(worker)
+        wait_time = None
+        if timeout is not None:
+            wait_time = max(0., min(worker.started + timeout for worker in busy) - time.time())
+        ready = wait([worker.conn for worker in busy], wait_time)
+        for worker in list(busy):
+            finished = worker.result(ready, timeout)
+            if finished is None:
+                continue
+            results[worker.task_index], recycle = finished
+            busy.remove(worker)
+            if recycle:
+                worker.stop()
+                num_restarted += 1
+            else:
+                idle.append(worker)
+    for worker in idle:
+        worker.close()
+    if num_restarted:
+        print(num_restarted, 'workers were stopped and replaced')
+    return results
+
+
+class SupervisedPool:
+    'jobs supervised workers with the apply_async interface of multiprocessing.Pool'
+    # The tasks are started and their results collected by a thread, the
+    # callbacks are called from this thread like the ones of a Pool.
+    def __init__(self, jobs=1, timeout=None, memory_limit=None):
+        self.jobs = jobs
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        # (run_task, task, callback) of the tasks that wait for a worker
+        self.pending = deque()
+        self.closed = False
+        self.terminated = False
+        self.wake_conn, self.wake_sender = multiprocessing.Pipe(duplex=False)
+        self.thread = threading.Thread(target=self.supervise)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def apply_async(self, run_task, args, callback=None, error_callback=None):
+        # run_task has to be the same for all tasks of the pool, the errors
+        # are results like in run_supervised_tasks
+        self.pending.append((run_task, args[0], callback))
+        self.wake_sender.send(None)
+
+    def close(self):
+        self.closed = True
+        self.wake_sender.send(None)
+
+    def terminate(self):
+        self.terminated = True
+        self.close()
+
+    def join(self):
+        self.thread.join()
+
+    def supervise(self):
+        idle = []
+        busy = []
+        callbacks = dict()
+        num_restarted = 0
+        while not self.terminated and not (self.closed and not self.pending and not busy):
+            while self.pending and len(busy) < self.jobs:
+                run_task, task, callback = self.pending.popleft()
+                worker = idle.pop() if idle else Worker(run_task, self.memory_limit)
+                worker.start(None, task)
+                callbacks[worker] = callback
+                busy.append(worker)
+            wait_time = None
+            if self.timeout is not None and busy:
+                wait_time = max(0., min(worker.started + self.timeout for worker in busy) - time.time())
+            ready = wait([worker.conn for worker in busy] + [self.wake_conn], wait_time)
+            while self.wake_conn.poll():
+                self.wake_conn.recv()
+            for worker in list(busy):
+                finished = worker.result(ready, self.timeout)
+                if finished is None:
+                    continue
+                result, recycle = finished
+                busy.remove(worker)
+                if recycle:
+                    worker.stop()
+                    num_restarted += 1
+                else:
+                    idle.append(worker)
+                callback = callbacks.pop(worker)
+                if callback is not None:
+                    callback(result)
+        for worker in busy:
+            worker.stop()
+        for worker in idle:
+            worker.close()
+        if num_restarted:
+            print(num_restarted, 'workers were stopped and replaced')
@@ -0,0 +1,138 @@
+from settings import *
+import numpy as np
+
+
+'''
+Key detection with a lookup table over the 4096 pitch class masks.
+
+The key of a song are its key_n most played pitch classes (histo_to_key),
+as a mask bit i is set if pitch class i is in the key. The table maps every
+mask to the scale family, the root and the shift of the song, with the
+same scales and the same order of checks as get_scales, get_shift and
+count_scales in data_processing.
+'''
+
+
+scale_families = ['diatonic', 'harmonic', 'melodic', 'blues', 'other']
+other = scale_families.index('other')
+
+family_scales = [(0,2,4,5,7,9,11), (0,2,4,5,8,9,11), (0,2,4,6,8,9,11), (0,3,5,6,7,10)]
+
+
+def notes_to_mask(notes):
+    mask = 0
+    for note in notes:
+        mask |= 1 << (int(note) % octave)
+    return mask
+
+
+def make_key_table():
+    # family, root and shift of every mask, the shift is only defined for
+    # diatonic keys and -1 otherwise
+    family_masks = [[notes_to_mask(np.array(scale) + root) for root in range(octave)]
+                    for scale in family_scales]
+    families = np.full(2**octave, other, dtype=np.int8)
+    roots = np.full(2**octave, -1, dtype=np.int8)
+    for mask in range(1, 2**octave):
+        # The blues scale has 6 notes and is compared without the highest key note
+        without_highest = mask & ~(1 << (mask.bit_length() - 1))
+        for family, masks in enumerate(family_masks):
+            scale_mask = without_highest if scale_families[family] == 'blues' else mask
+            if scale_mask in masks:
+                families[mask] = family
+                roots[mask] = masks.index(scale_mask)
+                break
+    shifts = np.where(families == scale_families.index('diatonic'), roots, -1).astype(np.int8)
+    return families, roots, shifts
+
+
+key_families, key_roots, key_shifts = make_key_table()
+
+
+def histos_to_key_masks(song_histos, key_n=key_n):
+    # Key masks of a stack of song histograms with shape (songs, 12), the
+    # same argsort as histo_to_key
+    max_n = np.asarray(song_histos).argsort(axis=-1)[..., -key_n:]
+    return np.sum(np.int64(1) << max_n, axis=-1)
+
+
+def classify_song_histos(song_histos, key_n=key_n):
+    # Returns the key masks, scale families, roots and shifts of all songs
+    masks = histos_to_key_masks(song_histos, key_n)
+    return masks, key_families[masks], key_roots[masks], key_shifts[masks]
+
+
+def get_shift(key):
+    # Same as data_processing.get_shift for a key tuple
+    shift = key_shifts[notes_to_mask(key)]
+    if shift < 0:
+        return 'other'
+    return int(shift)
+
+
+def get_family(key):
+    return scale_families[key_families[notes_to_mask(key)]]
+
+
+# Krumhansl-Kessler key profiles of C major and C minor
+major_profile = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+minor_profile = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+# Key i < 12 is the major key with root i, key 12 + i the minor key with root i
+key_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+key_names = key_names + [name + 'm' for name in key_names]
+
+
+def make_key_templates():
+    # The 24 profiles standardized to mean 0 and norm 1, one per row
+    templates = np.array([np.roll(profile, root) for profile in (major_profile, minor_profile)
+                          for root in range(octave)])
+    templates = templates - templates.mean(axis=1, keepdims=True)
+    return templates / np.linalg.norm(templates, axis=1, keepdims=True)
+
+
+key_templates = make_key_templates()
+
+# A major key is shifted to C major and a minor key to A minor, like the
+# diatonic scales of get_shift
+template_shifts = np.concatenate([np.arange(octave), (np.arange(octave) + 3) % octave])
+
+
+def estimate_keys(song_histos):
+    # Correlates a stack of song histograms with shape (songs, 12) with the
+    # 24 key profiles in one matrix multiply. Returns the key index, the
+    # correlation of the best key as confidence and the shift of every song.
+    # Songs without any notes have no key and get confidence nan.
+    histos = np.asarray(song_histos, dtype=np.float64).reshape(-1, octave)
+    centered = histos - histos.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centered, axis=1, keepdims=True)
+    centered = np.divide(centered, norms, out=np.zeros_like(centered), where=norms != 0)
+    correlations = centered.dot(key_templates.T)
+    keys = np.argmax(correlations, axis=1)
+    confidences = np.where(norms[:, 0] != 0, correlations[np.arange(len(keys)), keys], np.nan)
+    return keys, confidences, template_shifts[keys]
+
+
+def estimated_key_names(song_histos):
+    # Name of the estimated key of every song, 'other' for the songs without
+    # notes or below key_min_confidence, which the template estimator does not shift
+    keys, confidences, _ = estimate_keys(song_histos)
+    return [key_names[key] if confidence >= key_min_confidence else 'other'
+            for key, confidence in zip(keys, confidences)]
+
+
+def get_song_shifts(song_histos):
+    # Shift of every song with the key_estimator of the settings, -1 for the
+    # songs that are not shifted
+    if key_estimator == 'template':
+        _, confidences, shifts = estimate_keys(song_histos)
+        return np.where(confidences >= key_min_confidence, shifts, -1)
+    _, _, _, shifts = classify_song_histos(np.reshape(song_histos, (-1, octave)), key_n)
+    return shifts.astype(np.int64)
+
+
+def get_song_shift(song_histo):
+    shift = get_song_shifts([song_histo])[0]
+    if shift < 0:
+        return 'other'
+    return int(shift)
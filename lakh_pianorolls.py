@@ -0,0 +1,86 @@
+from settings import *
+import numpy as np
+import midi_functions as mf
+import data_processing as dp
+from scipy import sparse
+from collections import Counter
+import pickle
+import os
+
+
+'''
+Chords of the piano_rolls.npz files of the processed Lakh dataset.
+
+The tracks of a song are stored as scipy csc matrices with shape (time, 128).
+They are added up and binarized in sparse form and the bar histograms are
+made from the nonzero entries, so the dense piano roll is never built. The
+songs are processed in a pool of workers, and in the counting pass the
+chords of every song are streamed to a file instead of being kept in memory
+until the indexing pass reads them back.
+'''
+
+
+def load_sparse_pianoroll(filepath):
+    # The binarized sum of all tracks of a piano_rolls.npz with shape (128, time)
+    with np.load(filepath) as loaded:
+        keys = sorted(loaded.files)
+        tracks = []
+        csc_keys = [key for key in keys if '_csc_' in key]
+        for idx in range(int(len(csc_keys)/4)):
+            data, indices, indptr, shape = [loaded[key] for key in csc_keys[4*idx:4*idx+4]]
+            tracks.append(sparse.csc_matrix((data, indices, indptr), shape=shape))
+        tracks += [sparse.csc_matrix(loaded[key]) for key in keys if '_csc_' not in key]
+    if not tracks:
+        return sparse.csr_matrix((128, 0))
+    total = tracks[0].copy()
+    for track in tracks[1:]:
+        total = total + track
+    total.data = (total.data > 0).astype(np.int64)
+    total.eliminate_zeros()
+    return total.T.tocsr()
+
+
+def npz_to_chords(_path):
+    pianoroll = load_sparse_pianoroll(os.path.join(_path, 'piano_rolls.npz'))
+    histo_bar = mf.pianoroll_to_histo_bar(pianoroll, samples_per_bar)
+    histo_oct = mf.histo_bar_to_histo_oct(histo_bar, octave)
+    return mf.histo_to_chords(histo_oct, chord_n)
+
+
+def count_and_stream_chords(paths, stream_path, jobs=1):
+    # Counts the chords of all songs and writes the chords of every song to
+    # stream_path, one pickle per song in the order of paths
+    chord_cntr = Counter()
+    with open(stream_path, 'wb') as stream:
+        for chords in dp.imap_jobs(npz_to_chords, paths, jobs, 64):
+            for chord in chords:
+                if chord in chord_cntr:
+                    chord_cntr[chord] += 1
+                else:
+                    chord_cntr[chord] = 1
+            pickle.dump(chords, stream)
+    return chord_cntr
+
+
+def save_chord_indexes(paths, stream_path, chord_to_index):
+    # Reads the chords of the songs back from stream_path one at a time
+    with open(stream_path, 'rb') as stream:
+        for _path in paths:
+            chords = pickle.load(stream)
+            chords_index = [chord_to_index.get(chord, chord_to_index[UNK]) for chord in chords]
+            with open(_path+'/jambot_chord.pkl', 'wb') as f:
+                pickle.dump(chords_index, f)
+
+
+def make_chord_indexes(path, paths, jobs=1):
+    # Chord dict of the songs in paths saved to path and the jambot style
+    # chord index sequence of every song saved next to its piano_rolls.npz
+    stream_path = path + '/chords_stream.pkl'
+    chord_cntr = count_and_stream_chords(paths, stream_path, jobs)
+
+    chord_to_index, index_to_chord = dp.save_chord_dict(
+        chord_cntr.most_common(n=num_chords - 1), path + '/chord_to_index.pkl', path + '/index_to_chord.pkl')
+
+    save_chord_indexes(paths, stream_path, chord_to_index)
+    os.remove(stream_path)
+    return chord_to_index, index_to_chord
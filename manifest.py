@@ -0,0 +1,132 @@
+from settings import *
+import hashlib
+import pickle
+import os
+
+
+def get_settings_signature():
+    # The settings that change the content of the processed files
+    return {'fs': fs, 'samples_per_bar': samples_per_bar, 'octave': octave,
+            'chord_n': chord_n, 'key_n': key_n, 'num_chords': num_chords,
+            'key_estimator': key_estimator, 'key_min_confidence': key_min_confidence,
+            'double_sample_notes': double_sample_notes, 'sample_factor': sample_factor,
+            'high_crop': high_crop, 'low_crop': low_crop,
+            'discretize_time': discretize_time, 'offset_time': offset_time}
+
+
+# The settings every stage reads, by the function of its tasks. The index
+# stages have the chord dict as input file instead. The stages that are not
+# listed, like the fused mode, depend on all settings.
+shift_settings = ('key_n', 'key_estimator', 'key_min_confidence')
+roll_settings = ('fs', 'double_sample_notes', 'sample_factor')
+stage_settings = {
+    'change_tempo': ('discretize_time', 'offset_time'),
+    'change_tempo_file': ('discretize_time', 'offset_time'),
+    'midi_to_histo_oct': roll_settings + ('samples_per_bar', 'octave'),
+    'load_histo_save_song_histo': (),
+    'shift_midi': shift_settings,
+    'shift_midi_file': shift_settings,
+    'save_note_ind': roll_settings,
+    'load_histo_save_chords': ('chord_n',),
+    'load_histo_save_chord_masks': ('chord_n',),
+    'chords_to_index_save': (),
+    'chord_masks_to_index_save': (),
+}
+
+
+def get_stage_signature(stage):
+    signature = get_settings_signature()
+    if stage in stage_settings:
+        return {name: signature[name] for name in stage_settings[stage]}
+    return signature
+
+
+def shard_file_name(name, index, count):
+    # 'manifest.pickle' -> 'manifest_0_of_4.pickle', the state files of a shard
+    # are its own so that the shard processes do not overwrite each other
+    root, ext = os.path.splitext(name)
+    return root + '_' + str(index) + '_of_' + str(count) + ext
+
+
+def save_pickle(data, path):
+    # Written to a temporary file that replaces path, so that a reader never
+    # sees a partly written file
+    temp_path = path + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_path, 'wb') as f:
+        pickle.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def file_hash(filepath):
+    md5 = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+class Manifest:
+    'records from which inputs and settings every processed file was made'
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        # output file -> (stage, settings of the stage, {input file: content hash})
+        self.outputs = dict()
+        # file -> (size, mtime, content hash), to not hash unchanged files again
+        self.hashes = dict()
+        self.signatures = dict()
+        if os.path.exists(manifest_path):
+            data = pickle.load(open(manifest_path, 'rb'))
+            self.hashes = data['hashes']
+            if 'settings' in data:
+                print('manifest without stages, all files will be processed again')
+            else:
+                self.outputs = data['outputs']
+
+    def get_signature(self, stage):
+        if stage not in self.signatures:
+            self.signatures[stage] = get_stage_signature(stage)
+        return self.signatures[stage]
+
+    def get_hash(self, filepath):
+        stat = os.stat(filepath)
+        cached = self.hashes.get(filepath)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+            return cached[2]
+        content_hash = file_hash(filepath)
+        self.hashes[filepath] = (stat.st_size, stat.st_mtime, content_hash)
+        return content_hash
+
+    def input_hashes(self, input_files):
+        return {filepath: self.get_hash(filepath) for filepath in input_files}
+
+    def is_up_to_date(self, output_file, input_files, stage=None):
+        recorded = self.outputs.get(output_file)
+        if recorded is None or not os.path.exists(output_file):
+            return False
+        if recorded[0] != stage or recorded[1] != self.get_signature(stage):
+            return False
+        try:
+            return recorded[2] == self.input_hashes(input_files)
+        except OSError:
+            return False
+
+    def record(self, output_file, input_files, stage=None):
+        self.outputs[output_file] = (stage, self.get_signature(stage), self.input_hashes(input_files))
+
+    def forget(self, output_file):
+        self.outputs.pop(output_file, None)
+
+    def stale_outputs(self, stages, folder, outputs):
+        # The recorded outputs of stages in folder that are not in outputs
+        folder = folder.rstrip('/') + '/'
+        return [output_file for output_file, recorded in self.outputs.items()
+                if recorded[0] in stages and output_file.startswith(folder) and output_file not in outputs]
+
+    def merge(self, other):
+        # Adds the records of another manifest, like the one of a shard
+        self.outputs.update(other.outputs)
+        self.hashes.update(other.hashes)
+
+    def save(self):
+        data = {'outputs': self.outputs, 'hashes': self.hashes}
+        save_pickle(data, self.manifest_path)
@@ -7,6 +7,7 @@ import os
 import sys
 import pretty_midi as pm
 import mido
+from scipy import sparse
 
 
 #p = pickle.load(open(path + name + '.pickle', 'rb'))
@@ -25,15 +26,59 @@ import mido
 def shift_midi(shift, name, tempo_path, target_path):
     
     midi = pm.PrettyMIDI(tempo_path + name)
-    
+    shift_pretty_midi(midi, shift)
+    midi.write(target_path + name)
+
+
+def shift_pretty_midi(midi, shift):
     for instrument in midi.instruments:
         if not instrument.is_drum:
             for note in instrument.notes:
                 note.pitch -= shift
-    
-    midi.write(target_path + name)
+                if note.pitch < 0:
+                    # Writing and reading the shifted file would fail for this note
+                    raise ValueError('Note pitch out of range after shift: ' + str(note.pitch))
+
+
+
+def check_shift(midi, shift):
+    # Raises the same error as shift_pretty_midi without changing the song
+    for instrument in midi.instruments:
+        if not instrument.is_drum:
+            for note in instrument.notes:
+                if note.pitch - shift < 0:
+                    raise ValueError('Note pitch out of range after shift: ' + str(note.pitch - shift))
+
+
+# Semitones a pitch bend can move a note in the piano roll of pretty_midi
+max_bend_semitones = 2
+
+
+def shift_keeps_roll(midi, shift):
+    # If the roll of the song after shift_midi is the roll of the song moved
+    # down by shift pitches. pretty_midi moves the notes of a bent instrument
+    # by up to max_bend_semitones and drops the ones moved over the highest or
+    # below the lowest pitch, the shift can bring such notes back or drop others.
+    for instrument in midi.instruments:
+        if instrument.is_drum or all(abs(bend.pitch) < 1 for bend in instrument.pitch_bends):
+            continue
+        for note in instrument.notes:
+            if note.pitch > num_notes - 1 - max_bend_semitones or note.pitch - shift < max_bend_semitones:
+                return False
+    return True
 
 
+def shift_note_index(note_ind, shift):
+    # Note indexes of the song after shift_midi, drums are not in the piano roll
+    return [tuple(note - shift for note in step) for step in note_ind]
+
+
+def shift_histo_bar(histo_bar, shift):
+    # Bar histogram of the song after shift_midi, the lowest shift pitches have
+    # to be empty, otherwise the shift would fail
+    shifted = np.zeros_like(histo_bar)
+    shifted[:histo_bar.shape[0]-shift] = histo_bar[shift:]
+    return shifted
 
 
 def chords_to_index(chords,chord_to_index):
@@ -57,21 +102,28 @@ def histo_to_key(histo, key_n):
     return tuple(max_n)
 
 
+# Sorted pitch classes of every pitch class bitmask
+pitch_class_sets = [np.flatnonzero((mask >> np.arange(octave)) & 1) for mask in range(2**octave)]
+
+
+def histo_to_chord_masks(histo, chord_n):
+    # Bitmask of the chord_n most played pitch classes of every bar that are
+    # played at all, for one histo_oct or a stack of them with shape (songs, 12, bars)
+    max_n = histo.argsort(axis=-2)[..., -chord_n:, :]
+    played = np.take_along_axis(histo, max_n, axis=-2) != 0
+    return np.sum(played.astype(np.int64) << max_n, axis=-2)
+
+
 def histo_to_chords(histo, chord_n):
-    max_n = histo.argsort(axis=0)[-chord_n:]
-    chords = []
-    for i in range(0,max_n.shape[1]):
-        chord = []
-#        print('chord: ')
-        for note in max_n[:,i]:
-#            print(note)
-            if histo[note,i] != 0:
-                chord.append(note)
-        chord.sort()
-#        print(chord)
-        chords.append(tuple(chord))
-#    print(chords)
-    return chords
+    masks = histo_to_chord_masks(histo, chord_n)
+    return [tuple(pitch_class_sets[mask]) for mask in masks.tolist()]
+
+
+def histos_to_chords(histos, chord_n, num_bars):
+    # Chords of a stack of zero padded histo_octs, num_bars are the song lengths
+    masks = histo_to_chord_masks(histos, chord_n)
+    return [[tuple(pitch_class_sets[mask]) for mask in song_masks[:song_bars]]
+            for song_masks, song_bars in zip(masks.tolist(), num_bars)]
 
 def print_song(song):
     for step in song:
@@ -83,16 +135,18 @@ def print_song(song):
 
 
 def pianoroll_to_note_index(pianoroll):
-    note_ind = []
-    for i in range(0,pianoroll.shape[1]):
-        step = []
-        for j, note in enumerate(pianoroll[:,i]):
-#            print(note, '  ', i, '    ', pianoroll[note,i])
-            if note != 0:
-#                print('note!')
-                step.append(j)
-        note_ind.append(tuple(step))
-#    print(chords)
+    if sparse.issparse(pianoroll):
+        p = sparse.csr_matrix(pianoroll.T)
+        p.sort_indices()
+        notes = p.indices.tolist()
+        bounds = p.indptr.tolist()
+        return [tuple(notes[bounds[i]:bounds[i+1]]) for i in range(p.shape[0])]
+    num_steps = pianoroll.shape[1]
+    # nonzero of the transposed roll is ordered by time step and then by note
+    steps, notes = np.nonzero(np.transpose(pianoroll))
+    bounds = [0] + np.searchsorted(steps, np.arange(1, num_steps)).tolist() + [len(notes)]
+    notes = notes.tolist()
+    note_ind = [tuple(notes[bounds[i]:bounds[i+1]]) for i in range(num_steps)]
     return note_ind
 
 
@@ -109,14 +163,35 @@ def load_histo_save_chords(chord_n, name, histo_path, chords_path):
 
 
 def pianoroll_to_histo_bar(pianoroll, samples_per_bar):
-    # Make histogramm for every samples_per_bar samples
-    histo_bar = np.zeros((pianoroll.shape[0], int(pianoroll.shape[1]/samples_per_bar)))
-    for i in range(0,pianoroll.shape[1]-samples_per_bar+1,samples_per_bar):
-    #    print(i/samples_per_bar)
-    #    print('i: ',i)
-    #    print(i+samples_per_bar)
-        histo_bar[:,int(i/samples_per_bar)] = np.sum(pianoroll[:,i:i+samples_per_bar], axis=1)
-    return histo_bar
+    if sparse.issparse(pianoroll):
+        return sparse_pianoroll_to_histo_bar(pianoroll, samples_per_bar)
+    # Make histogramm for every samples_per_bar samples, also for a stack of
+    # rolls with shape (songs, 128, T)
+    num_notes = pianoroll.shape[-2]
+    num_bars = int(pianoroll.shape[-1]/samples_per_bar)
+    bars = pianoroll[..., :num_bars*samples_per_bar]
+    bars = bars.reshape(pianoroll.shape[:-2] + (num_notes, num_bars, samples_per_bar))
+    return bars.sum(axis=-1, dtype=np.float64)
+
+
+def pianoroll_to_root_notes(pianoroll, samples_per_bar):
+    # The lowest note of every bar, 0 for an empty bar
+    histo_bar = pianoroll_to_histo_bar(pianoroll, samples_per_bar)
+    return np.argmax(histo_bar != 0, axis=0).tolist()
+
+
+def pianoroll_to_pitch_histo(pianoroll, dtype=None):
+    # Number of steps every pitch is played, of a dense or a sparse roll
+    return np.asarray(pianoroll.sum(axis=1, dtype=dtype)).ravel()
+
+
+def sparse_pianoroll_to_histo_bar(pianoroll, samples_per_bar):
+    num_bars = int(pianoroll.shape[1]/samples_per_bar)
+    p = pianoroll.tocoo()
+    in_bar = p.col < num_bars*samples_per_bar
+    bins = p.row[in_bar].astype(np.int64)*num_bars + p.col[in_bar] // samples_per_bar
+    histo_bar = np.bincount(bins, weights=p.data[in_bar], minlength=pianoroll.shape[0]*num_bars)
+    return histo_bar.reshape((pianoroll.shape[0], num_bars))
 
 
 def pianoroll_to_histo_song(pianoroll, samples_per_bar):
@@ -131,12 +206,11 @@ def pianoroll_to_histo_song(pianoroll, samples_per_bar):
 
 
 def histo_bar_to_histo_oct(histo_bar, octave):
-    histo_oct = np.zeros((octave, histo_bar.shape[1]))
-    for i in range(0, histo_bar.shape[0]-octave+1, octave):
-#        print('i: ',i)
-#        print(i+octave)
-        histo_oct = np.add(histo_oct, histo_bar[i:i+octave])
-    return histo_oct
+    # Adds up the full octaves, also for a stack of histo_bars
+    num_octaves = int(histo_bar.shape[-2]/octave)
+    octaves = histo_bar[..., :num_octaves*octave, :]
+    octaves = octaves.reshape(histo_bar.shape[:-2] + (num_octaves, octave, histo_bar.shape[-1]))
+    return octaves.sum(axis=-3, dtype=np.float64)
 
     
 def save_pianoroll_to_histo_oct(samples_per_bar,octave, name, path, histo_path):
@@ -150,76 +224,184 @@ def save_pianoroll_to_histo_oct(samples_per_bar,octave, name, path, histo_path):
 def midi_to_histo_oct(samples_per_bar,octave, fs, name, path, histo_path):
 #    print(path + name)
     pianoroll = get_pianoroll(name, path, fs)
-    histo_bar = pianoroll_to_histo_bar(pianoroll, samples_per_bar)
-    histo_oct = histo_bar_to_histo_oct(histo_bar, octave)
+    histo_oct = pianoroll_to_histo_oct(pianoroll, samples_per_bar, octave)
     pickle.dump(histo_oct,open(histo_path + name + '.pickle' , 'wb'))
 
 
+def pianoroll_to_histo_oct(pianoroll, samples_per_bar, octave):
+    if sparse.issparse(pianoroll):
+        histo_bar = pianoroll_to_histo_bar(pianoroll, samples_per_bar)
+        return histo_bar_to_histo_oct(histo_bar, octave)
+    # The counts are the same in both orders, folding the octaves first only
+    # has to sum up the bars of 12 instead of 128 rows
+    return pianoroll_to_histo_bar(histo_bar_to_histo_oct(pianoroll, octave), samples_per_bar)
+
+
 def save_pianoroll(name, path, target_path, fs):
-    mid = pm.PrettyMIDI(path + name)
+    import note_cache
+    mid = note_cache.read_midi(path + name)
     p = mid.get_piano_roll(fs=fs)
-    for i, _ in enumerate(p):
-        for j, _ in enumerate(p[i]):
-            if p[i, j] != 0:
-                p[i,j] = 1
+    # The saved rolls stay float rolls of 0 and 1
+    p[p != 0] = 1
 #    print(np.argwhere(p[:,:]))
     pickle.dump(p,open(target_path + name + '.pickle', 'wb'))
 
 
 def double_sample(mid):
     p_double = mid.get_piano_roll(fs=fs*sample_factor)
-    p = []
-    for i in range(0,p_double.shape[1], sample_factor):
-        vec = np.sum(p_double[:,i:(i+sample_factor)], axis=1)
-#        print(vec[36])
-        
-        p.append(vec)
-    p = np.array(p)
-#    print(p[0,36])
-    p = np.transpose(p)
-#    print(p[36,0])
-#    for i, _ in enumerate(p):
-#        for j, _ in enumerate(p[i]):
-#            if p[i, j] != 0:
-#                p[i,j] = 1
-#    n_double = mf.pianoroll_to_note_index(p_double)
-#    n_new = mf.pianoroll_to_note_index(p)
+    num_steps = -(-p_double.shape[1] // sample_factor)
+    if num_steps == 0:
+        # An empty song has no 2d roll, the following steps fail on it
+        return np.array([])
+    # Sums every sample_factor samples, the last window may be shorter
+    padding = num_steps*sample_factor - p_double.shape[1]
+    p_double = np.pad(p_double, ((0, 0), (0, padding)), 'constant')
+    p = p_double.reshape((p_double.shape[0], num_steps, sample_factor)).sum(axis=2)
     return p
 
 
 
 def save_note_ind(name, path, target_path, fs):
-    mid = pm.PrettyMIDI(path + name)
-    if double_sample_notes:
-        p = double_sample(mid)
-    else:
-        p = mid.get_piano_roll(fs=fs)
-    for i, _ in enumerate(p):
-        for j, _ in enumerate(p[i]):
-            if p[i, j] != 0:
-                p[i,j] = 1
-    n = mf.pianoroll_to_note_index(p)
+    import note_cache
+    mid = note_cache.read_midi(path + name)
+    p = binarize_pianoroll(get_notes_from_midi(mid, fs))
+    n = pianoroll_to_note_index(p)
 #    print(np.argwhere(p[:,:]))
     pickle.dump(n,open(target_path + name + '.pickle', 'wb'))
 
 
 def get_notes(name, path, fs):
-    mid = pm.PrettyMIDI(path + name)
+    import note_cache
+    mid = note_cache.read_midi(path + name)
+    return get_notes_from_midi(mid, fs)
+
+
+def get_notes_from_midi(mid, fs):
+    if sparse_pianorolls:
+        return get_sparse_pianoroll(mid, fs)
     if double_sample_notes:
         p = double_sample(mid)
     else:
         p = mid.get_piano_roll(fs=fs)
     return p
 
+
+def get_sparse_pianoroll(mid, fs):
+    # Binary roll as scipy csr matrix, with the same notes as get_notes
+    if not double_sample_notes:
+        return sparse_pianoroll(mid, fs)
+    p = sparse_pianoroll(mid, fs*sample_factor).tocoo()
+    num_steps = -(-p.shape[1] // sample_factor)
+    if num_steps == 0:
+        # double_sample has no 2d roll for an empty song and the next steps fail
+        raise IndexError('Empty piano roll')
+    return cells_to_sparse_pianoroll(p.row, p.col // sample_factor, num_steps)
+
+
+def sparse_pianoroll(mid, fs):
+    # Builds the binarized get_piano_roll of the song from the note intervals,
+    # without allocating the dense 128 x T roll. Sustain pedals and pitch bends
+    # are applied to the intervals the same way get_piano_roll applies them.
+    num_steps = 0
+    rows = []
+    cols = []
+    for instrument in mid.instruments:
+        if instrument.notes == []:
+            continue
+        end_time = instrument.get_end_time()
+        num_steps = max(num_steps, int(fs*end_time))
+        if instrument.is_drum:
+            continue
+        pitches = np.array([note.pitch for note in instrument.notes], dtype=np.int64)
+        starts = np.array([int(note.start*fs) for note in instrument.notes], dtype=np.int64)
+        ends = np.array([int(note.end*fs) for note in instrument.notes], dtype=np.int64)
+        ends = sustain_intervals(instrument, fs, starts, ends)
+        pitches, starts, ends = bend_intervals(instrument, fs, end_time, pitches, starts, ends)
+        lengths = np.maximum(ends - starts, 0)
+        rows.append(np.repeat(pitches, lengths))
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        cols.append(np.repeat(starts, lengths) + offsets)
+    if rows:
+        return cells_to_sparse_pianoroll(np.concatenate(rows), np.concatenate(cols), num_steps)
+    return cells_to_sparse_pianoroll(np.array([], dtype=np.int64), np.array([], dtype=np.int64), num_steps)
+
+
+def cells_to_sparse_pianoroll(rows, cols, num_steps):
+    cells = np.unique(rows.astype(np.int64)*num_steps + cols)
+    data = np.ones(len(cells), dtype=np.uint8)
+    return sparse.csr_matrix((data, (cells // num_steps, cells % num_steps)), shape=(128, num_steps))
+
+
+def sustain_intervals(instrument, fs, starts, ends, pedal_threshold=64):
+    # A sustain pedal holds every note that sounds while it is pressed until
+    # the pedal is released, like the running maximum in get_piano_roll
+    time_pedal_on = 0
+    is_pedal_on = False
+    for cc in instrument.control_changes:
+        if cc.number != 64:
+            continue
+        time_now = int(cc.time*fs)
+        is_current_pedal_on = (cc.value >= pedal_threshold)
+        if not is_pedal_on and is_current_pedal_on:
+            time_pedal_on = time_now
+            is_pedal_on = True
+        elif is_pedal_on and not is_current_pedal_on:
+            held = (starts < ends) & (starts < time_now) & (ends > time_pedal_on)
+            ends = np.where(held, np.maximum(ends, time_now), ends)
+            is_pedal_on = False
+    return ends
+
+
+def bend_intervals(instrument, fs, end_time, pitches, starts, ends):
+    # A pitch bend moves the notes by its whole semitones and get_piano_roll
+    # interpolates the rest, which also sounds the next note in bend direction
+    ordered_bends = sorted(instrument.pitch_bends, key=lambda bend: bend.time)
+    end_bend = pm.PitchBend(0, end_time)
+    for start_bend, end_bend in zip(ordered_bends, ordered_bends[1:] + [end_bend]):
+        if np.abs(start_bend.pitch) < 1:
+            continue
+        start_pitch = pm.pitch_bend_to_semitones(start_bend.pitch)
+        bend_int = int(np.sign(start_pitch)*np.floor(np.abs(start_pitch)))
+        bend_decimal = np.abs(start_pitch - bend_int)
+        bend_start = int(start_bend.time*fs)
+        bend_end = int(end_bend.time*fs)
+        inside = (starts < ends) & (starts < bend_end) & (ends > bend_start) & (bend_start < bend_end)
+        if not inside.any():
+            continue
+        before = inside & (starts < bend_start)
+        after = inside & (ends > bend_end)
+        bent_pitches = pitches[inside] + bend_int
+        bent_starts = np.maximum(starts[inside], bend_start)
+        bent_ends = np.minimum(ends[inside], bend_end)
+        valid = (bent_pitches >= 0) & (bent_pitches < 128)
+        bent_pitches, bent_starts, bent_ends = bent_pitches[valid], bent_starts[valid], bent_ends[valid]
+        if bend_decimal > 0:
+            direction = 1 if start_bend.pitch >= 0 else -1
+            neighbours = (bent_pitches + direction >= 0) & (bent_pitches + direction < 128)
+            bent_pitches = np.concatenate((bent_pitches, bent_pitches[neighbours] + direction))
+            bent_starts = np.concatenate((bent_starts, bent_starts[neighbours]))
+            bent_ends = np.concatenate((bent_ends, bent_ends[neighbours]))
+        pitches = np.concatenate((pitches[~inside], pitches[before], bent_pitches, pitches[after]))
+        starts = np.concatenate((starts[~inside], starts[before], bent_starts, np.full(after.sum(), bend_end, dtype=np.int64)))
+        ends = np.concatenate((ends[~inside], np.full(before.sum(), bend_start, dtype=np.int64), bent_ends, ends[after]))
+    return pitches, starts, ends
+
     
 def get_pianoroll(name, path, fs):
     p = get_notes(name, path, fs)
-    for i, _ in enumerate(p):
-        for j, _ in enumerate(p[i]):
-            if p[i, j] != 0:
-                p[i,j] = 1
-#    print(np.argwhere(p[:,:]))
-    return p
+    return binarize_pianoroll(p)
+
+
+def get_pianoroll_from_midi(mid, fs):
+    p = get_notes_from_midi(mid, fs)
+    return binarize_pianoroll(p)
+
+
+def binarize_pianoroll(p):
+    # uint8 roll with a 1 for every played note
+    if sparse.issparse(p):
+        return p
+    return (p != 0).astype(np.uint8)
 
 
 def pianoroll_to_midi(pianoroll, midi_folder, filename, instrument_name, bpm):
@@ -286,7 +468,9 @@ def print_type_of_folder(folderpath):
 
 
 def get_type(filepath):
-    return mido.MidiFile(filepath).type
+    # Imported here, midi_metadata imports midi_functions through smf_rewrite
+    import midi_metadata
+    return midi_metadata.read_header(filepath)[0]
 
 
 def change_tempo_folder(data_path, target_path):
@@ -311,25 +495,33 @@ def change_tempo(filename, data_path, target_path):
         new_track = mido.MidiTrack()
         for msg in track:
             new_msg = msg.copy()
-            if new_msg.type == 'set_tempo':
-                new_msg.tempo = 500000
-#            if msg.type == 'note_on' or msg.type == 'note_off':
-            if discretize_time:
-                print(msg.time)
-                new_msg.time = myround(msg.time, base=mid.ticks_per_beat/(discritezition/4) )
-#                msg.time = myround(msg.time, base=mid.ticks_per_beat/(discritezition/4) )
-            if offset_time:
-#                print('first:', time)
-                
-                print((mid.ticks_per_beat/(offset/4)))
-                new_msg.time = int(msg.time + mid.ticks_per_beat/(offset))
-#                print('second:', new_time)
-#                print('diff:',time )
-#            msg.time = time
+            change_msg_tempo(new_msg, mid.ticks_per_beat)
             new_track.append(new_msg)
         new_mid.tracks.append(new_track)
     new_mid.save(target_path + filename)
 
+
+def change_tempo_in_place(mid):
+    # Same as change_tempo but on an already parsed mido file
+    for track in mid.tracks:
+        for msg in track:
+            change_msg_tempo(msg, mid.ticks_per_beat)
+
+
+def change_msg_tempo(msg, ticks_per_beat):
+    time = msg.time
+    if msg.type == 'set_tempo':
+        msg.tempo = 500000
+#            if msg.type == 'note_on' or msg.type == 'note_off':
+    if discretize_time:
+        print(time)
+        msg.time = myround(time, base=ticks_per_beat/(discritezition/4) )
+    if offset_time:
+#                print('first:', time)
+        
+        print((ticks_per_beat/(offset/4)))
+        msg.time = int(time + ticks_per_beat/(offset))
+
                 
 def change_tempo2(filename, data_path, target_path):
     mid = mido.MidiFile(data_path + filename)
@@ -348,48 +540,55 @@ def change_tempo2(filename, data_path, target_path):
     new_mid.save(target_path + filename)
                 
 def get_ticks_per_beat(data_path):
+    import midi_metadata
     filenames = os.listdir(data_path)
     for filename in filenames:
         try:
-            print( MidiFile(data_path + filename).ticks_per_beat)
+            print(midi_metadata.read_header(data_path + filename)[2])
         except (ValueError, EOFError, IndexError, OSError, KeyError, ZeroDivisionError) as e:
             exception_str = 'Unexpected error in ' + filename  + ':\n', e, sys.exc_info()[0]
             print(exception_str)   
 
 
 def get_tempi_of_folder(data_path):
+    import midi_metadata
     filenames = os.listdir(data_path)
     for filename in filenames:
         try:
-            print(filename, ':\n', pm.PrettyMIDI(data_path + filename).get_tempo_changes())
+            (_, ticks_per_beat, _, _, _), tempi, _, _ = midi_metadata.scan_midi(data_path + filename)
+            print(filename, ':\n', midi_metadata.get_tempo_changes(ticks_per_beat, tempi))
         except (ValueError, EOFError, IndexError, OSError, KeyError, ZeroDivisionError) as e:
             exception_str = 'Unexpected error in ' + filename  + ':\n', e, sys.exc_info()[0]
             print(exception_str)
 
 def get_time_signature_of_folder(data_path):
+    import midi_metadata
     filenames = os.listdir(data_path)
     for filename in filenames:
         try:
-            print(pm.PrettyMIDI(data_path + filename).time_signature_changes)
+            _, _, time_signatures, _ = midi_metadata.scan_midi(data_path + filename)
+            print([(numerator, denominator, time) for _, _, time, numerator, denominator in time_signatures])
         except (ValueError, EOFError, IndexError, OSError, KeyError, ZeroDivisionError) as e:
             exception_str = 'Unexpected error in ' + filename  + ':\n', e, sys.exc_info()[0]
             print(exception_str)
 
 def create_tempo_histogram(data_path):
-    invalid_midi_files = np.chararray([])
-    exception_str_arr= np.chararray([])
-    tempo_array = np.array([])
+    import note_cache
+    invalid_midi_files = []
+    exception_strs = []
+    tempi = []
     filenames = os.listdir(data_path)
     num_files = len(filenames)
     for i, filename in enumerate(filenames):
         print('file ', i, 'of ', num_files)
         try:
-            tempo = pm.PrettyMIDI(data_path + filename).estimate_tempo()
-            tempo_array = np.append(tempo_array, tempo)
+            tempi.append(note_cache.read_midi(data_path + filename).estimate_tempo())
         except (ValueError, EOFError, IndexError, OSError, KeyError, ZeroDivisionError) as e:
             exception_str = 'Unexpected error in ' + filename  + ':\n', e, sys.exc_info()[0]
             print(exception_str)
-            invalid_midi_files = np.append(invalid_midi_files, filename)
-            exception_str_arr = np.append(exception_str_arr, exception_str)
-    tempo_histogram = np.histogram(tempo_array)
+            invalid_midi_files.append(filename)
+            exception_strs += [str(s) for s in exception_str]
+    tempo_histogram = np.histogram(np.array(tempi))
+    invalid_midi_files = np.array(invalid_midi_files)
+    exception_str_arr = np.array(exception_strs)
     return tempo_histogram, invalid_midi_files, exception_str_arr
@@ -0,0 +1,227 @@
+from settings import *
+import numpy as np
+import smf_rewrite
+import data_processing as dp
+import pickle
+import os
+import argparse
+from collections import Counter
+
+
+'''
+Metadata of all MIDI files of the corpus in one columnar table.
+
+The files are not parsed into messages, the scanner reads the header chunk
+and walks the events of the tracks with smf_rewrite.smf_events, keeping
+only the tempo, time signature and key signature meta events. A file is
+valid if mido could read it. The table has one array per column for the
+files and one structured array for each kind of meta event, with the index
+of the file in every row, and the corpus statistics are queries on it.
+'''
+
+
+tempo_meta_type = 0x51
+time_signature_meta_type = 0x58
+key_signature_meta_type = 0x59
+
+tempo_dtype = np.dtype([('file', np.int64), ('track', np.int32), ('tick', np.int64),
+                        ('time', np.float64), ('tempo', np.int64)])
+time_signature_dtype = np.dtype([('file', np.int64), ('track', np.int32), ('tick', np.int64),
+                                 ('time', np.float64), ('numerator', np.int32), ('denominator', np.int64)])
+key_signature_dtype = np.dtype([('file', np.int64), ('track', np.int32), ('tick', np.int64),
+                                ('time', np.float64), ('key_number', np.int32)])
+
+file_columns = [('format', np.int16), ('ticks_per_beat', np.int16), ('num_tracks', np.int16),
+                ('max_tick', np.int64), ('duration', np.float64)]
+
+
+def read_header(filepath):
+    # Format, number of tracks and ticks per beat from the first bytes of the file
+    with open(filepath, 'rb') as f:
+        file_type, num_tracks, ticks_per_beat, _ = smf_rewrite.read_smf_header(f.read(14))
+    return file_type, num_tracks, ticks_per_beat
+
+
+def key_number(sharps, minor):
+    # pretty_midi key number of a key signature, 0-11 major and 12-23 minor keys
+    if sharps > 127:
+        sharps -= 256
+    tonic = (sharps*7 + 9*minor) % 12
+    return tonic + 12*minor
+
+
+def get_tick_scales(ticks_per_beat, tempi):
+    # The tick scales pretty_midi makes from the tempo events of the first
+    # track, the rows of tempi are (track, tick, ..., tempo)
+    tick_scales = [(0, 60.0/(120.0*ticks_per_beat))]
+    for row in tempi:
+        track, tick, tempo = row[0], row[1], row[-1]
+        if track != 0:
+            continue
+        tick_scale = 60.0/((6e7/tempo)*ticks_per_beat)
+        if tick == 0:
+            tick_scales = [(0, tick_scale)]
+        elif tick_scale != tick_scales[-1][1]:
+            tick_scales.append((tick, tick_scale))
+    return tick_scales
+
+
+def ticks_to_times(ticks, tick_scales):
+    ticks = np.asarray(ticks, dtype=np.int64)
+    starts = np.array([tick for tick, _ in tick_scales])
+    scales = np.array([scale for _, scale in tick_scales])
+    start_times = np.concatenate([[0.], np.cumsum(np.diff(starts)*scales[:-1])])
+    segment = np.searchsorted(starts, ticks, side='right') - 1
+    return start_times[segment] + (ticks - starts[segment])*scales[segment]
+
+
+def get_tempo_changes(ticks_per_beat, tempi):
+    # Times and tempi in bpm like PrettyMIDI.get_tempo_changes
+    tick_scales = get_tick_scales(ticks_per_beat, tempi)
+    times = ticks_to_times([tick for tick, _ in tick_scales], tick_scales)
+    return times, np.array([60.0/(scale*ticks_per_beat) for _, scale in tick_scales])
+
+
+def scan_midi(filepath):
+    # The header fields, last tick and duration of a file and its tempo,
+    # time signature and key signature events
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    file_type, num_tracks, ticks_per_beat, _ = smf_rewrite.read_smf_header(data)
+    tempi = []
+    time_signatures = []
+    key_signatures = []
+    max_tick = 0
+    for track, tick, status, start, body, end in smf_rewrite.smf_events(data):
+        if tick > max_tick:
+            max_tick = tick
+        if status != 0xFF:
+            continue
+        meta_type = data[start+1]
+        if meta_type == tempo_meta_type:
+            tempi.append((track, tick, (data[body] << 16) | (data[body+1] << 8) | data[body+2]))
+        elif meta_type == time_signature_meta_type:
+            time_signatures.append((track, tick, data[body], 2**data[body+1]))
+        elif meta_type == key_signature_meta_type:
+            key_signatures.append((track, tick, key_number(data[body], data[body+1])))
+    if ticks_per_beat > 0:
+        tick_scales = get_tick_scales(ticks_per_beat, tempi)
+        duration = ticks_to_times([max_tick], tick_scales)[0]
+    else:
+        # SMPTE timing, the times in seconds are not computed
+        tick_scales = None
+        duration = np.nan
+    events = [add_times(rows, tick_scales) for rows in (tempi, time_signatures, key_signatures)]
+    return [(file_type, ticks_per_beat, num_tracks, max_tick, duration)] + events
+
+
+def add_times(rows, tick_scales):
+    # Inserts the time in seconds after the tick of every (track, tick, ...) row
+    if tick_scales is None:
+        times = [np.nan]*len(rows)
+    else:
+        times = ticks_to_times([row[1] for row in rows], tick_scales).tolist()
+    return [row[:2] + (time,) + row[2:] for row, time in zip(rows, times)]
+
+
+def scan_chunk(filepaths):
+    # Scans the files of a chunk, returns (scan, error class) of every file
+    results = []
+    for filepath in filepaths:
+        try:
+            results.append((scan_midi(filepath), ''))
+        except (ValueError, EOFError, IndexError, OSError, KeyError, ZeroDivisionError) as e:
+            results.append((None, type(e).__name__))
+    return results
+
+
+def make_metadata_table(filepaths, results):
+    # The columnar table of the scans of the files
+    table = {'paths': list(filepaths),
+             'valid': np.array([scan is not None for scan, _ in results], dtype=bool),
+             'error': [error for _, error in results]}
+    header = [scan[0] if scan is not None else (0, 0, 0, 0, np.nan) for scan, _ in results]
+    for column, (name, dtype) in enumerate(file_columns):
+        table[name] = np.array([row[column] for row in header], dtype=dtype)
+    for kind, (name, dtype) in enumerate([('tempi', tempo_dtype), ('time_signatures', time_signature_dtype),
+                                          ('key_signatures', key_signature_dtype)]):
+        table[name] = np.array([(i,) + row for i, (scan, _) in enumerate(results) if scan is not None
+                                for row in scan[1 + kind]], dtype=dtype)
+    return table
+
+
+def scan_folder(folder, jobs=1, chunk_size=256):
+    filepaths = []
+    for path, subdirs, files in os.walk(folder):
+        _path = path.replace('\\', '/') + '/'
+        filepaths += [_path + name.replace('\\', '/') for name in files]
+    chunks = [filepaths[i:i+chunk_size] for i in range(0, len(filepaths), chunk_size)]
+    scans = list(dp.imap_jobs(scan_chunk, chunks, jobs))
+    return make_metadata_table(filepaths, [result for chunk in scans for result in chunk])
+
+
+def load_metadata_table(table_path=midi_metadata_path):
+    return pickle.load(open(table_path, 'rb'))
+
+
+# Queries on the table
+
+def invalid_files(table):
+    return [(path, error) for path, valid, error in zip(table['paths'], table['valid'], table['error'])
+            if not valid]
+
+
+def format_counts(table):
+    return Counter(table['format'][table['valid']].tolist())
+
+
+def ticks_per_beat_counts(table):
+    return Counter(table['ticks_per_beat'][table['valid']].tolist())
+
+
+def first_tempi(table):
+    # Tempo in bpm at the start of every valid file, as pretty_midi reads it
+    tempi = np.full(len(table['paths']), 120.)
+    first_track = table['tempi'][(table['tempi']['track'] == 0) & (table['tempi']['tick'] == 0)]
+    # The last tempo event at tick 0 is the one pretty_midi keeps
+    tempi[first_track['file']] = 6e7/first_track['tempo']
+    return tempi[table['valid']]
+
+
+def tempo_histogram(table, bins=10):
+    return np.histogram(first_tempi(table), bins=bins)
+
+
+def num_tempo_changes(table):
+    return np.bincount(table['tempi']['file'], minlength=len(table['paths']))[table['valid']]
+
+
+def time_signature_counts(table):
+    signatures = table['time_signatures']
+    return Counter(zip(signatures['numerator'].tolist(), signatures['denominator'].tolist()))
+
+
+def key_signature_counts(table):
+    return Counter(table['key_signatures']['key_number'].tolist())
+
+
+def print_summary(table):
+    print(len(table['paths']), 'files,', np.sum(~table['valid']), 'invalid')
+    print('formats:', dict(format_counts(table)))
+    print('ticks per beat:', ticks_per_beat_counts(table).most_common(10))
+    print('tempo histogram:', tempo_histogram(table))
+    print('files with tempo changes:', np.sum(num_tempo_changes(table) > 1))
+    print('time signatures:', time_signature_counts(table).most_common(10))
+    print('key signatures:', key_signature_counts(table).most_common(10))
+    print('total duration: %.1f h' % (np.nansum(table['duration'])/3600))
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Scan the metadata of all MIDI files of a folder.')
+    parser.add_argument('folder', nargs='?', default=source_folder)
+    parser.add_argument('--jobs', type=int, default=num_jobs)
+    parser.add_argument('--output', default=midi_metadata_path)
+    args = parser.parse_args()
+    table = scan_folder(args.folder, args.jobs)
+    pickle.dump(table, open(args.output, 'wb'))
+    print_summary(table)
@@ -0,0 +1,139 @@
+from settings import *
+import numpy as np
+import pretty_midi as pm
+import hashlib
+import pickle
+import os
+
+
+'''
+Cache of the parsed content of MIDI files.
+
+The notes of a file are stored as one structured array in a .npy file that
+is loaded memory mapped, everything else pretty_midi reads (instruments,
+control changes, pitch bends, tempo, time and key signatures, lyrics and
+text events) as small tables in a pickle next to it. read_midi returns a
+PrettyMIDI object made from the cache without parsing the file again, so
+it can be used everywhere instead of pm.PrettyMIDI to read a song.
+'''
+
+
+note_dtype = np.dtype([('pitch', np.uint8), ('start', np.float64), ('end', np.float64),
+                       ('velocity', np.uint8), ('program', np.uint8), ('is_drum', np.bool_),
+                       ('instrument', np.uint16)])
+control_dtype = np.dtype([('instrument', np.uint16), ('time', np.float64),
+                          ('number', np.uint8), ('value', np.uint8)])
+pitch_bend_dtype = np.dtype([('instrument', np.uint16), ('time', np.float64), ('pitch', np.int16)])
+tick_scale_dtype = np.dtype([('tick', np.int64), ('scale', np.float64)])
+time_signature_dtype = np.dtype([('time', np.float64), ('numerator', np.int64), ('denominator', np.int64)])
+key_signature_dtype = np.dtype([('time', np.float64), ('key_number', np.int64)])
+
+
+def midi_to_tables(midi):
+    # The notes array and the table dict of a PrettyMIDI object
+    notes = []
+    controls = []
+    pitch_bends = []
+    for i, instrument in enumerate(midi.instruments):
+        notes += [(note.pitch, note.start, note.end, note.velocity, instrument.program,
+                   instrument.is_drum, i) for note in instrument.notes]
+        controls += [(i, cc.time, cc.number, cc.value) for cc in instrument.control_changes]
+        pitch_bends += [(i, bend.time, bend.pitch) for bend in instrument.pitch_bends]
+    tables = {
+        'resolution': midi.resolution,
+        'instruments': [(instrument.program, instrument.is_drum, instrument.name)
+                        for instrument in midi.instruments],
+        'controls': np.array(controls, dtype=control_dtype),
+        'pitch_bends': np.array(pitch_bends, dtype=pitch_bend_dtype),
+        'tick_scales': np.array(midi._tick_scales, dtype=tick_scale_dtype),
+        'time_signatures': np.array([(ts.time, ts.numerator, ts.denominator)
+                                     for ts in midi.time_signature_changes], dtype=time_signature_dtype),
+        'key_signatures': np.array([(ks.time, ks.key_number) for ks in midi.key_signature_changes],
+                                   dtype=key_signature_dtype),
+        'lyrics': [(lyric.text, lyric.time) for lyric in midi.lyrics],
+        'text_events': [(text.text, text.time) for text in midi.text_events],
+    }
+    return np.array(notes, dtype=note_dtype), tables
+
+
+class CachedMidi(pm.PrettyMIDI):
+    'PrettyMIDI made from the cached tables of a MIDI file, the instruments are only made when used'
+    def __init__(self, notes, tables):
+        pm.PrettyMIDI.__init__(self, resolution=tables['resolution'])
+        self.notes = notes
+        self.tables = tables
+        self._instruments = None
+        self._tick_scales = [(int(tick), float(scale)) for tick, scale in tables['tick_scales']]
+        self.time_signature_changes = [pm.TimeSignature(int(numerator), int(denominator), float(time))
+                                       for time, numerator, denominator in tables['time_signatures']]
+        self.key_signature_changes = [pm.KeySignature(int(key_number), float(time))
+                                      for time, key_number in tables['key_signatures']]
+        self.lyrics = [pm.Lyric(text, time) for text, time in tables['lyrics']]
+        self.text_events = [pm.Text(text, time) for text, time in tables['text_events']]
+
+    @property
+    def instruments(self):
+        if self._instruments is None:
+            self._instruments = self.make_instruments()
+        return self._instruments
+
+    @instruments.setter
+    def instruments(self, instruments):
+        self._instruments = instruments
+
+    def make_instruments(self):
+        instruments = [pm.Instrument(program, is_drum, name)
+                       for program, is_drum, name in self.tables['instruments']]
+        for pitch, start, end, velocity, _, _, i in self.notes.tolist():
+            instruments[i].notes.append(pm.Note(velocity, pitch, start, end))
+        for i, time, number, value in self.tables['controls'].tolist():
+            instruments[i].control_changes.append(pm.ControlChange(number, value, time))
+        for i, time, pitch in self.tables['pitch_bends'].tolist():
+            instruments[i].pitch_bends.append(pm.PitchBend(pitch, time))
+        return instruments
+
+
+def cache_files(filepath):
+    # Notes and tables file of a MIDI file, named by the hash of its path
+    key = hashlib.md5(os.path.abspath(filepath).encode('utf-8')).hexdigest()
+    folder = note_cache_folder + '/' + key[:2] + '/'
+    return folder + key + '.npy', folder + key + '.pickle'
+
+
+def file_signature(filepath):
+    stat = os.stat(filepath)
+    return stat.st_size, stat.st_mtime
+
+
+def load_cached_midi(filepath, mmap_mode='r'):
+    # The cached song if the file did not change since it was cached, else None
+    notes_file, tables_file = cache_files(filepath)
+    if not os.path.exists(tables_file):
+        return None
+    tables = pickle.load(open(tables_file, 'rb'))
+    if tables['source'] != file_signature(filepath):
+        return None
+    return CachedMidi(np.load(notes_file, mmap_mode=mmap_mode), tables)
+
+
+def cache_midi(filepath):
+    # Parses the file and saves its notes and tables in the cache
+    midi = pm.PrettyMIDI(filepath)
+    notes, tables = midi_to_tables(midi)
+    tables['source'] = file_signature(filepath)
+    notes_file, tables_file = cache_files(filepath)
+    if not os.path.exists(os.path.dirname(notes_file)):
+        os.makedirs(os.path.dirname(notes_file), exist_ok=True)
+    np.save(notes_file, notes)
+    pickle.dump(tables, open(tables_file, 'wb'))
+    return midi
+
+
+def read_midi(filepath):
+    # Drop-in for pm.PrettyMIDI(filepath) that uses the cache if use_note_cache is set
+    if not use_note_cache:
+        return pm.PrettyMIDI(filepath)
+    midi = load_cached_midi(filepath)
+    if midi is None:
+        midi = cache_midi(filepath)
+    return midi
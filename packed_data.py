@@ -0,0 +1,119 @@
+from settings import *
+import numpy as np
+import pickle
+import os
+
+
+'''
+Packed store of the indroll and chord_index folders.
+
+Every shard holds the songs of songs_per_shard pickles in a few flat arrays:
+    notes           uint8, the notes of all time steps after each other
+    step_offsets    int64, start of every time step in notes (+ the end)
+    song_offsets    int64, start of every song in step_offsets (+ the end)
+    chords          int16, the chord indexes of all songs after each other
+    chord_offsets   int64, start of every song in chords (+ the end)
+The arrays are saved as .npy files, so they can be opened memory mapped.
+'''
+
+
+shard_arrays = ['notes', 'step_offsets', 'song_offsets', 'chords', 'chord_offsets']
+
+
+def shard_file(packed_folder, shard, array_name):
+    return packed_folder + '/shard_%04d_%s.npy' % (shard, array_name)
+
+
+def save_shard(packed_folder, shard, songs, song_chords):
+    step_lengths = [len(step) for song in songs for step in song]
+    arrays = dict()
+    arrays['notes'] = np.array([note for song in songs for step in song for note in step], dtype=np.uint8)
+    arrays['step_offsets'] = np.concatenate(([0], np.cumsum(step_lengths, dtype=np.int64)))
+    arrays['song_offsets'] = np.concatenate(([0], np.cumsum([len(song) for song in songs], dtype=np.int64)))
+    arrays['chords'] = np.array([chord for chords in song_chords for chord in chords], dtype=np.int16)
+    arrays['chord_offsets'] = np.concatenate(([0], np.cumsum([len(chords) for chords in song_chords], dtype=np.int64)))
+    for array_name in shard_arrays:
+        np.save(shard_file(packed_folder, shard, array_name), arrays[array_name])
+
+
+def pack_ind_data_set(roll_folder, chords_index_folder, packed_folder, songs_per_shard=packed_songs_per_shard):
+    # Reads the same songs as data_class.make_ind_data_set and packs them into shards
+    if not os.path.exists(packed_folder):
+        os.makedirs(packed_folder)
+    # Imported here, data_class reads the packed store
+    import data_class
+    names = []
+    shard_sizes = []
+    songs = []
+    song_chords = []
+    for _path, _name in data_class.list_song_files(roll_folder):
+        song = pickle.load(open(_path + _name, 'rb'))
+        _chord_path = chords_index_folder + _path[len(roll_folder):]
+        chords = pickle.load(open(_chord_path + _name, 'rb'))
+        names.append(_path[len(roll_folder):] + _name)
+        songs.append(song)
+        song_chords.append(chords)
+        if len(songs) == songs_per_shard:
+            save_shard(packed_folder, len(shard_sizes), songs, song_chords)
+            shard_sizes.append(len(songs))
+            songs = []
+            song_chords = []
+    if songs:
+        save_shard(packed_folder, len(shard_sizes), songs, song_chords)
+        shard_sizes.append(len(songs))
+    pickle.dump({'names': names, 'shard_sizes': shard_sizes}, open(packed_folder + '/songs.pickle', 'wb'))
+    return names
+
+
+class PackedSongs:
+    'sequence of the songs of a packed store, a song is only unpacked when it is accessed'
+    def __init__(self, shards, shard_starts, names, indices, chords=False):
+        self.shards = shards
+        self.shard_starts = shard_starts
+        self.names = names
+        self.indices = indices
+        self.chords = chords
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return PackedSongs(self.shards, self.shard_starts, self.names, self.indices[i], self.chords)
+        return self.get_song(self.indices[i])
+
+    def __iter__(self):
+        for index in self.indices:
+            yield self.get_song(index)
+
+    def locate(self, index):
+        shard = np.searchsorted(self.shard_starts, index, side='right') - 1
+        return self.shards[shard], index - self.shard_starts[shard]
+
+    def get_song(self, index):
+        arrays, i = self.locate(index)
+        if self.chords:
+            start, end = arrays['chord_offsets'][i:i+2]
+            return [int(chord) for chord in arrays['chords'][start:end]]
+        return self.get_song_steps(arrays, i)
+
+    def get_song_steps(self, arrays, i):
+        step_start, step_end = arrays['song_offsets'][i:i+2]
+        offsets = arrays['step_offsets'][step_start:step_end+1]
+        notes = arrays['notes'][offsets[0]:offsets[-1]].tolist()
+        offsets = (offsets - offsets[0]).tolist()
+        return [tuple(notes[offsets[j]:offsets[j+1]]) for j in range(len(offsets)-1)]
+
+
+def load_packed_ind_data_set(packed_folder, mmap_mode='r'):
+    # Returns the songs and the chords like data_class.make_ind_data_set
+    info = pickle.load(open(packed_folder + '/songs.pickle', 'rb'))
+    shards = []
+    for shard in range(len(info['shard_sizes'])):
+        shards.append({array_name: np.load(shard_file(packed_folder, shard, array_name), mmap_mode=mmap_mode)
+                       for array_name in shard_arrays})
+    shard_starts = np.concatenate(([0], np.cumsum(info['shard_sizes'])))[:-1]
+    indices = np.arange(len(info['names']))
+    data = PackedSongs(shards, shard_starts, info['names'], indices)
+    chord_data = PackedSongs(shards, shard_starts, info['names'], indices, chords=True)
+    return data, chord_data
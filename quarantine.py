@@ -0,0 +1,167 @@
+from settings import *
+from manifest import file_hash, shard_file_name, save_pickle
+from collections import Counter
+import pickle
+import os
+import argparse
+
+
+'''
+Quarantine of the files that failed a stage.
+
+The per file stages of data_processing record every file that raised one of
+the expected errors, with the content hash of the file, the stage (the
+function of the task) and the exception class. Later runs skip a file in the
+stage it failed without opening it as long as its size and modification time
+are unchanged, and a file with a different content is processed again. The
+loaders of data_class skip the processed files of quarantined songs, which
+are named after the MIDI file.
+'''
+
+
+class Quarantine:
+    'files that failed a stage, recorded by their content hash'
+    def __init__(self, quarantine_path):
+        self.quarantine_path = quarantine_path
+        # content hash -> {stage: exception class}
+        self.failures = dict()
+        # file -> (size, mtime, content hash) of the quarantined files
+        self.files = dict()
+        if os.path.exists(quarantine_path):
+            data = pickle.load(open(quarantine_path, 'rb'))
+            self.failures = data['failures']
+            self.files = data['files']
+
+    def get_hash(self, filepath):
+        # The recorded hash of a quarantined file, None if its content changed
+        # since. The file is only read if its size or modification time changed.
+        cached = self.files.get(filepath)
+        if cached is None:
+            return None
+        try:
+            stat = os.stat(filepath)
+            if (cached[0], cached[1]) != (stat.st_size, stat.st_mtime):
+                # Written again, it stays quarantined if the content is the same
+                if cached[0] != stat.st_size or file_hash(filepath) != cached[2]:
+                    return None
+                self.files[filepath] = (stat.st_size, stat.st_mtime, cached[2])
+        except OSError:
+            return None
+        return cached[2]
+
+    def is_quarantined(self, filepath, stage=None):
+        # If the file failed stage, or any stage if stage is None
+        content_hash = self.get_hash(filepath)
+        if content_hash is None:
+            return False
+        stages = self.failures.get(content_hash, dict())
+        if stage is None:
+            return len(stages) > 0
+        return stage in stages
+
+    def add(self, filepath, stage, exception_class):
+        stat = os.stat(filepath)
+        content_hash = file_hash(filepath)
+        self.files[filepath] = (stat.st_size, stat.st_mtime, content_hash)
+        self.failures.setdefault(content_hash, dict())[stage] = exception_class
+
+    def names(self):
+        # Names of the quarantined files
+        return set(os.path.basename(filepath) for filepath, (_, _, content_hash) in self.files.items()
+                   if self.failures.get(content_hash))
+
+    def release(self, stage=None):
+        # Removes the files that failed stage, or all files, from the
+        # quarantine so they are processed again. Returns their number.
+        released = 0
+        for content_hash in list(self.failures):
+            stages = self.failures[content_hash]
+            if stage is None or stage in stages:
+                released += 1
+                if stage is None:
+                    stages.clear()
+                else:
+                    del stages[stage]
+            if not stages:
+                del self.failures[content_hash]
+        self.files = {filepath: cached for filepath, cached in self.files.items()
+                      if cached[2] in self.failures}
+        return released
+
+    def counts(self):
+        # Number of quarantined files per (stage, exception class)
+        return Counter((stage, exception_class) for stages in self.failures.values()
+                       for stage, exception_class in stages.items())
+
+    def merge(self, other):
+        # Adds the failures of another quarantine, like the one of a shard
+        for content_hash, stages in other.failures.items():
+            self.failures.setdefault(content_hash, dict()).update(stages)
+        self.files.update(other.files)
+
+    def save(self):
+        data = {'failures': self.failures, 'files': self.files}
+        save_pickle(data, self.quarantine_path)
+
+
+_quarantine = None
+
+
+def set_shard(index, count):
+    # A shard process records its failures in its own file, they are merged
+    # into the quarantine of dict_path by merge_shard_quarantines
+    global shard_index, num_shards, _quarantine
+    shard_index = index
+    num_shards = count
+    _quarantine = None
+
+
+def get_quarantine():
+    # The quarantine of dict_path, or of the shard, if use_quarantine is set, else None
+    global _quarantine
+    if use_quarantine and _quarantine is None:
+        name = quarantine_name
+        if num_shards > 1:
+            name = shard_file_name(quarantine_name, shard_index, num_shards)
+        _quarantine = Quarantine(dict_path + name)
+    return _quarantine
+
+
+def merge_shard_quarantines(count):
+    # The quarantine of dict_path made from the quarantines of count shards,
+    # for the loaders and the runs without shards
+    merged = Quarantine(dict_path + quarantine_name)
+    merged.failures = dict()
+    merged.files = dict()
+    for index in range(count):
+        merged.merge(Quarantine(dict_path + shard_file_name(quarantine_name, index, count)))
+    merged.save()
+    return merged
+
+
+def quarantined_names():
+    # Names of the quarantined MIDI files for the loaders, empty if use_quarantine is not set
+    quarantine = get_quarantine()
+    if quarantine is None:
+        return set()
+    return quarantine.names()
+
+
+def is_quarantined_song(name, names):
+    # If a processed file like 'x.mid.pickle' belongs to a quarantined song
+    if name.endswith('.pickle'):
+        name = name[:-len('.pickle')]
+    return name in names
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Show or release the quarantined files.')
+    parser.add_argument('--retry', nargs='?', const='', metavar='STAGE',
+                        help='release all files, or the files that failed STAGE, to process them again')
+    args = parser.parse_args()
+    quarantine = Quarantine(dict_path + quarantine_name)
+    for (stage, exception_class), count in sorted(quarantine.counts().items()):
+        print(stage, exception_class, count)
+    if args.retry is not None:
+        print(quarantine.release(args.retry or None), 'files released')
+        quarantine.save()
@@ -10,6 +10,25 @@ if shifted:
 
 subfolder = ''
 
+# Number of worker processes for the per file processing stages
+num_jobs = 1
+
+# Worker processes of single stages in the pipelined run (--pipeline), like
+# {'histo': 4, 'note_ind': 2}, the other stages have num_jobs
+stage_jobs = {}
+
+# Shard of the songs this run processes, by the hash of the song names
+# (--shard I/N), the chord dict is made by merging the shards (--merge-shards N)
+shard_index = 0
+num_shards = 1
+
+# Supervise the workers of the per file stages: a worker is stopped and
+# replaced if a file takes more than file_timeout seconds or more than
+# file_memory_limit bytes of address space, and the file is reported as
+# failed (file_watchdog.py). None is no limit.
+file_timeout = None
+file_memory_limit = None
+
 data_folder = '/data1/lakh/lmd_matched_test_0208'
 # data_folder = '/home/wan/Documents/projects/data/test_lmd'
 processed_folder = '/data1/lakh/lmd_matched_processed_jambot_test_0208'
@@ -28,7 +47,16 @@ roll_folder = processed_folder + shift_folder + '/indroll' + subfolder
 histo_folder2 = processed_folder + shift_folder + '/histo' + subfolder
 chords_folder = processed_folder + shift_folder + '/chords' + subfolder
 chords_index_folder = processed_folder + shift_folder + '/chord_index' + subfolder
+chord_masks_folder = processed_folder + shift_folder + '/chord_masks' + subfolder
 song_histo_folder = processed_folder + shift_folder + '/song_histo' + subfolder
+packed_folder = processed_folder + shift_folder + '/packed' + subfolder
+# Chords and chord dicts of several chord settings made in one pass (chord_sweep.py)
+sweep_folder = processed_folder + shift_folder + '/sweep'
+
+# Load the note indexes and chords from the packed store in packed_folder
+# instead of the indroll and chord_index pickles, see packed_data.py
+use_packed_data = False
+packed_songs_per_shard = 5000
 
 
 
@@ -52,6 +80,23 @@ if shifted:
     chord_dict_name = 'chord_dict_shifted.pickle'
     index_dict_name = 'index_dict_shifted.pickle'
 
+# Records the inputs of every processed file for incremental runs
+manifest_name = 'manifest.pickle'
+
+# Records the files that failed a stage in dict_path + quarantine_name, later
+# runs and the loaders skip them until they change (quarantine.py)
+use_quarantine = False
+quarantine_name = 'quarantine.pickle'
+
+# Keeps the chord counts of every song in dict_path + chord_counts_name, so
+# the chord dict is made again from the counts of the changed songs only and
+# only the songs with a chord whose index changed are indexed again
+# (chord_vocabulary.py). With stable_vocabulary the chords of the current
+# chord dict keep their index and new chords only get the free indexes.
+incremental_vocabulary = False
+stable_vocabulary = False
+chord_counts_name = 'chord_counts.pickle'
+
 
 # Specifies the method how to add the chord information to the input vector
 # 'embed' uses the chord embeddinbg of the chord model
@@ -79,6 +124,40 @@ double_sample_notes = True
 
 sample_factor = 2
 
+# Build the binarized piano rolls as sparse matrices straight from the notes
+# instead of the dense pretty_midi piano roll
+sparse_pianorolls = False
+
+# Change the tempo and shift the songs by patching the bytes of the MIDI files
+# (smf_rewrite.py) instead of decoding and writing them with mido and pretty_midi
+raw_midi_rewrite = False
+
+# Read the songs from a cache of their parsed notes in note_cache_folder
+# (note_cache.py), a file is only parsed again with pretty_midi if it changed
+use_note_cache = False
+note_cache_folder = processed_folder + '/note_cache'
+
+# Columnar table of the header and meta events of all MIDI files, made by
+# python midi_metadata.py
+midi_metadata_path = processed_folder + '/midi_metadata.pickle'
+
+# List the songs of the source and processed folders from the corpus index
+# (corpus_index.py) instead of walking the folders. The index is loaded from
+# corpus_index_path, made by python corpus_index.py, or else built from the
+# song paths in corpus_paths_file.
+use_corpus_index = False
+corpus_index_path = processed_folder + '/corpus_index.pickle'
+corpus_paths_file = 'midi_data_paths.pkl'
+
+# Only process the songs kept by the deduplication (dedup.py), listed from
+# the index in dedup_index_path made by python dedup.py. dedup_signature also
+# drops the near duplicates of the same MSD track: None, 'histo' (pitch class
+# histogram) or 'onsets' (note onsets), with a similarity of dedup_threshold.
+use_dedup_index = False
+dedup_index_path = processed_folder + '/dedup_index.pickle'
+dedup_signature = None
+dedup_threshold = 0.95
+
 one_hot_input = False
 collapse_octaves = True
 discretize_time = False
@@ -98,12 +177,24 @@ melody_fs = 4
 chord_n = 3
 # Number of notes in a key
 key_n = 7
+# How the key of a song is found for the shift: 'scale' only shifts the songs
+# whose key_n most played pitch classes are a diatonic scale, 'template'
+# correlates the song histogram with the 24 major and minor key profiles
+key_estimator = 'scale'
+# With 'template', songs with a lower correlation to their key are not shifted
+key_min_confidence = 0.
 # Chord Vocabulary size
 num_chords = 100
 
 if shifted:
     num_chords = 50
 
+# The chords for the chord dict are counted exactly, or with a number of
+# counters here in bounded memory with the Space-Saving algorithm
+# (space_saving.py), which finds the same top chords if the vocabulary is
+# much smaller than the counters
+chord_counter_capacity = None
+
 UNK = '<unk>'
 
 
@@ -0,0 +1,253 @@
+from settings import *
+import struct
+from mido.midifiles.meta import build_meta_message
+
+
+'''
+Tempo normalization and transposition directly on the bytes of a Standard
+MIDI File.
+
+change_tempo and shift_midi in midi_functions decode every message with
+mido or pretty_midi and write the whole song again. The two stages only
+change the data of the set_tempo events and the pitch of the note on and
+note off events, so here the tracks are walked once and these bytes are
+patched in a copy of the file. Everything else keeps its original bytes.
+
+Files are rejected with the same errors as mido reading them would raise,
+so the same songs are skipped as with the mido and pretty_midi stages.
+pretty_midi drops the note events that do not make a note, like a note on
+and note off at the same tick, so a song with such an event below the shift
+is shifted with pretty_midi, which only raises for the notes it keeps.
+'''
+
+
+# Maximum meta and sysex length, the same limit as mido
+max_message_length = 1000000
+
+# Number of data bytes of the channel and system messages
+channel_data_lengths = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+system_data_lengths = {0xF1: 1, 0xF2: 2, 0xF3: 1, 0xF6: 0,
+                       0xF8: 0, 0xFA: 0, 0xFB: 0, 0xFC: 0, 0xFE: 0}
+realtime_status = (0xF8, 0xFA, 0xFB, 0xFC, 0xFE)
+
+drum_channel = 9
+tempo_meta_type = 0x51
+
+
+class PitchRangeError(ValueError):
+    'a note event that would be shifted below pitch 0'
+
+
+def read_var_int(data, pos):
+    value = 0
+    while True:
+        if pos >= len(data):
+            raise EOFError
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7f)
+        if byte < 0x80:
+            return value, pos
+
+
+def read_chunk_header(data, pos):
+    if pos + 8 > len(data):
+        raise EOFError
+    name, size = struct.unpack('>4sL', bytes(data[pos:pos+8]))
+    return name, size, pos + 8
+
+
+def read_body(data, pos, length):
+    if length > max_message_length:
+        raise OSError('Message length {} exceeds maximum length {}'.format(length, max_message_length))
+    if pos + length > len(data):
+        raise EOFError
+    return pos + length
+
+
+def read_smf_header(data):
+    # Returns the format, number of tracks and ticks per beat of the file and
+    # the position after the header chunk
+    name, size, pos = read_chunk_header(data, 0)
+    if name != b'MThd':
+        raise OSError('MThd not found. Probably not a MIDI file')
+    if min(size, len(data) - pos) < 6:
+        raise EOFError
+    file_type, num_tracks, ticks_per_beat = struct.unpack('>hhh', bytes(data[pos:pos+6]))
+    return file_type, num_tracks, ticks_per_beat, pos + size
+
+
+def track_chunks(data, pos, num_tracks):
+    # (start, end) of the data of every track, after smf_events checked them
+    chunks = []
+    for _ in range(max(num_tracks, 0)):
+        _, size, pos = read_chunk_header(data, pos)
+        chunks.append((pos, pos + size))
+        pos += size
+    return chunks
+
+
+def smf_events(data, saveable=False):
+    # Walks the events of every track mido reads and raises the errors mido
+    # raises reading the file (and with saveable saving it again). Yields
+    # (track, tick, status, start, body, end) of every event: start is the
+    # position of the status byte, body to end the data of the event, for
+    # meta events and sysex the data after the length.
+    file_type, num_tracks, _, pos = read_smf_header(data)
+    if saveable and file_type == 0 and max(num_tracks, 0) != 1:
+        raise ValueError('type 0 file must have exactly 1 track')
+    for track in range(max(num_tracks, 0)):
+        name, size, pos = read_chunk_header(data, pos)
+        if name != b'MTrk':
+            raise OSError('no MTrk header at start of track')
+        end = pos + size
+        tick = 0
+        last_status = None
+        while pos != end:
+            if pos > end:
+                # mido would read on into the next chunk and fail at its end
+                raise EOFError
+            delta, pos = read_var_int(data, pos)
+            tick += delta
+            if pos >= len(data):
+                raise EOFError
+            start = pos
+            status = data[pos]
+            running = status < 0x80
+            if running:
+                if last_status is None:
+                    raise OSError('running status without last_status')
+                status = last_status
+            else:
+                pos += 1
+                if status != 0xFF:
+                    last_status = status
+
+            if status == 0xFF:
+                if pos >= len(data):
+                    raise EOFError
+                meta_type = data[pos]
+                length, body = read_var_int(data, pos + 1)
+                pos = read_body(data, body, length)
+                # Raises the errors of mido for invalid meta data
+                build_meta_message(meta_type, list(data[body:pos]))
+            elif status == 0xF0 or status == 0xF7:
+                if running:
+                    # mido skips the data byte in place of the status
+                    pos += 1
+                length, body = read_var_int(data, pos)
+                pos = read_body(data, body, length)
+                sysex = data[body:pos]
+                if sysex[:1] == b'\xf0':
+                    sysex = sysex[1:]
+                if sysex[-1:] == b'\xf7':
+                    sysex = sysex[:-1]
+                if any(byte > 127 for byte in sysex):
+                    raise ValueError('data byte must be in range 0..127')
+            else:
+                if status < 0xF0:
+                    num_data = channel_data_lengths[status & 0xF0]
+                elif status in system_data_lengths:
+                    if saveable and status in realtime_status:
+                        raise ValueError('realtime messages are not allowed in MIDI files')
+                    num_data = system_data_lengths[status]
+                    if running and num_data == 0:
+                        raise ValueError('data byte after a message without data')
+                else:
+                    raise OSError('undefined status byte 0x{:02x}'.format(status))
+                body = pos
+                pos += num_data
+                if pos > len(data):
+                    raise EOFError
+                for byte in data[body:pos]:
+                    if byte > 127:
+                        raise OSError('data byte must be in range 0..127')
+            yield track, tick, status, start, body, pos
+
+
+def rewrite_smf(data, tempo=None, shift=0, saveable=False):
+    # Returns a copy of the file data with every set_tempo event changed to
+    # tempo (if it is not None) and the notes of all channels except the drum
+    # channel shifted down by shift. With saveable the file is also rejected
+    # if mido could read but not save it again, like change_tempo does.
+    out = bytearray(data)
+    # Edits that change the length of an event, (start, end, new bytes)
+    resized = []
+    if tempo is not None:
+        tempo_bytes = bytes([tempo >> 16, tempo >> 8 & 0xff, tempo & 0xff])
+    for _, _, status, start, body, end in smf_events(data, saveable):
+        if status == 0xFF:
+            if tempo is not None and data[start+1] == tempo_meta_type:
+                if end - body == 3:
+                    out[body:end] = tempo_bytes
+                else:
+                    resized.append((start, end, b'\xff\x51\x03' + tempo_bytes))
+        elif shift and (status & 0xE0) == 0x80 and (status & 0x0F) != drum_channel:
+            pitch = data[body] - shift
+            if pitch < 0:
+                # Same error as shift_pretty_midi if the event makes a note
+                raise PitchRangeError('Note pitch out of range after shift: ' + str(pitch))
+            out[body] = pitch
+
+    _, num_tracks, _, pos = read_smf_header(data)
+    chunks = track_chunks(data, pos, num_tracks)
+    # Data after the last track is not read by mido and dropped like mido does
+    if chunks:
+        del out[chunks[-1][1]:]
+    else:
+        del out[pos:]
+    if resized:
+        out = resize_events(out, [chunk_start for chunk_start, _ in chunks], resized)
+    return out
+
+
+def resize_events(out, track_starts, resized):
+    # Replaces events with new bytes of a different length and corrects the
+    # length of their tracks
+    pieces = []
+    last = 0
+    track_ends = track_starts[1:] + [len(out) + 8]
+    for start, end, new_bytes in resized:
+        pieces.append(out[last:start])
+        pieces.append(new_bytes)
+        last = end
+    pieces.append(out[last:])
+    result = bytearray(b''.join(pieces))
+    # Every track size moves with the size changes before its end
+    delta = 0
+    changes = iter(resized)
+    change = next(changes, None)
+    for track_start, next_start in zip(track_starts, track_ends):
+        track_delta = 0
+        while change is not None and change[0] < next_start - 8:
+            track_delta += len(change[2]) - (change[1] - change[0])
+            change = next(changes, None)
+        size_pos = track_start - 4 + delta
+        size = struct.unpack('>L', bytes(result[size_pos:size_pos+4]))[0]
+        result[size_pos:size_pos+4] = struct.pack('>L', size + track_delta)
+        delta += track_delta
+    return result
+
+
+def change_tempo_file(filename, data_path, target_path):
+    # Same as midi_functions.change_tempo
+    with open(data_path + filename, 'rb') as f:
+        data = f.read()
+    data = rewrite_smf(data, tempo=500000, saveable=True)
+    with open(target_path + filename, 'wb') as f:
+        f.write(data)
+
+
+def shift_midi_file(shift, name, tempo_path, target_path):
+    # Same as midi_functions.shift_midi
+    with open(tempo_path + name, 'rb') as f:
+        data = f.read()
+    try:
+        data = rewrite_smf(data, shift=shift)
+    except PitchRangeError:
+        # Raises the same error if the event is a note for pretty_midi too
+        import midi_functions as mf
+        mf.shift_midi(shift, name, tempo_path, target_path)
+        return
+    with open(target_path + name, 'wb') as f:
+        f.write(data)
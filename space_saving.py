@@ -0,0 +1,83 @@
+'''
+Space-Saving counts of the most frequent items of a stream.
+
+At most capacity items are counted. An item that is not counted yet takes
+the counter of the item with the lowest count, which is then at most an
+overcount of this lowest count, so every item with more than
+num_items/capacity occurrences is counted and the counts of the top items
+are at most max_error() too high. The counters are kept in buckets by count,
+so adding an item takes constant time. While there are less distinct items
+than counters the counts are exact and most_common returns the same list as
+Counter.most_common over the same stream.
+'''
+
+
+class SpaceSaving:
+    'approximate counts of the most frequent items of a stream in capacity counters'
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = dict()
+        # Overcount of every item, the count of the item it replaced
+        self.errors = dict()
+        # Position in the stream where an item got its counter, to order
+        # items with the same count like Counter.most_common
+        self.first_seen = dict()
+        # count -> items with this count
+        self.buckets = dict()
+        self.min_count = 0
+        self.num_items = 0
+
+    def add(self, item):
+        count = self.counts.get(item)
+        if count is None:
+            if len(self.counts) < self.capacity:
+                count = 0
+            else:
+                # The item that got the lowest count first gives up its counter
+                count = self.min_count
+                replaced = next(iter(self.buckets[count]))
+                self.remove_from_bucket(replaced, count)
+                del self.counts[replaced]
+                del self.errors[replaced]
+                del self.first_seen[replaced]
+            self.errors[item] = count
+            self.first_seen[item] = self.num_items
+        else:
+            self.remove_from_bucket(item, count)
+        count += 1
+        self.counts[item] = count
+        self.buckets.setdefault(count, dict())[item] = None
+        if count == 1 or self.min_count not in self.buckets:
+            self.min_count = count
+        self.num_items += 1
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def remove_from_bucket(self, item, count):
+        bucket = self.buckets[count]
+        del bucket[item]
+        if not bucket:
+            del self.buckets[count]
+
+    def most_common(self, n=None):
+        items = sorted(self.counts, key=lambda item: (-self.counts[item], self.first_seen[item]))
+        return [(item, self.counts[item]) for item in items[:n]]
+
+    def max_error(self):
+        # Upper bound of the overcount of every counted item and of the count
+        # of every item that is not counted
+        if len(self.counts) < self.capacity:
+            return 0
+        return self.min_count
+
+    def num_guaranteed(self, n):
+        # Number of the top n items that are surely among the n most frequent
+        # items: their count minus the overcount is at least the estimated
+        # count of the item after the top n
+        top = self.most_common(n + 1)
+        threshold = self.max_error()
+        if len(top) > n:
+            threshold = max(top[n][1], threshold)
+        return sum(count - self.errors[item] >= threshold for item, count in top[:n])
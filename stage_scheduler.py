@@ -0,0 +1,101 @@
+import multiprocessing
+import queue
+import os
+
+
+'''
+Pipelined execution of per file stages.
+
+The stages form a tree: every stage reads the output of its upstream stage
+for a song, named like the song with the suffix of the stage. Instead of
+running every stage over the whole corpus before the next one starts, a
+song is given to the stages after a stage as soon as its task there
+finished and its output exists, so the stages of different songs overlap.
+Every stage has its own pool of jobs worker processes (jobs 0 runs the
+tasks in the main process) and its FileTasks for the manifest, the
+quarantine and the error report. After all songs the files the manifest
+recorded for a stage whose task was not scheduled anymore are deleted.
+'''
+
+
+class Stage:
+    'per file stage, make_task(_path, _name, in_folder, out_folder) returns the task of a song or None'
+    def __init__(self, name, make_task, in_folder, out_folder, file_tasks, suffix='', upstream=None, jobs=1):
+        self.name = name
+        self.make_task = make_task
+        self.in_folder = in_folder
+        self.out_folder = out_folder
+        self.file_tasks = file_tasks
+        self.suffix = suffix
+        self.upstream = upstream
+        self.jobs = jobs
+        self.failed = []
+        self.num_tasks = 0
+
+
+def run_stages(stages, songs, run_task, make_pool=multiprocessing.Pool):
+    # Runs the stages on every song, songs are (sub path, name) relative to
+    # the input folder of the stages. make_pool(jobs) makes the pool of a
+    # stage, like a file_watchdog.SupervisedPool. Returns the errors of every stage.
+    downstream = {stage.name: [other for other in stages if other.upstream == stage.name] for stage in stages}
+    pools = {stage.name: make_pool(stage.jobs) for stage in stages if stage.jobs > 0}
+    events = queue.Queue()
+    num_running = 0
+
+    def submit(stage, song):
+        sub_path, name = song
+        _path = stage.in_folder + sub_path
+        _name = name + stage.suffix
+        if not os.path.exists(_path + _name):
+            # The upstream stage did not make this song, like a song that failed it
+            return 0
+        task = stage.make_task(_path, _name, stage.in_folder, stage.out_folder)
+        if task is None:
+            # The song does not go through this stage, like an unshifted song
+            return 0
+        func, args, task_name, errors, output_file, input_files = task
+        if stage.file_tasks.skip(func, output_file, input_files):
+            events.put((stage, song, None, None))
+            return 1
+        task = (func, args, task_name, errors)
+        product = (func, output_file, input_files)
+        stage.num_tasks += 1
+        if stage.jobs > 0:
+            pools[stage.name].apply_async(run_task, (task,),
+                                          callback=lambda result: events.put((stage, song, product, result)),
+                                          error_callback=lambda e: events.put((stage, song, product, e)))
+        else:
+            events.put((stage, song, product, run_task(task)))
+        return 1
+
+    finished = False
+    try:
+        for song in songs:
+            for stage in stages:
+                if stage.upstream is None:
+                    num_running += submit(stage, song)
+        while num_running > 0:
+            stage, song, product, result = events.get()
+            num_running -= 1
+            if isinstance(result, BaseException):
+                raise result
+            if product is not None:
+                func, output_file, input_files = product
+                stage.file_tasks.record(func, output_file, input_files, result)
+                if result is not None:
+                    stage.failed.append(result)
+                    continue
+            for next_stage in downstream[stage.name]:
+                num_running += submit(next_stage, song)
+        finished = True
+        for stage in stages:
+            stage.file_tasks.remove_stale()
+    finally:
+        for pool in pools.values():
+            if not finished:
+                pool.terminate()
+            pool.close()
+            pool.join()
+        for stage in stages:
+            stage.file_tasks.save()
+    return {stage.name: stage.failed for stage in stages}